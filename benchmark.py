@@ -0,0 +1,341 @@
+import argparse
+import json
+import logging
+import stat
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from board_locator import BoardLocator
+from board_detector import BoardDetector, IncrementalBoardDetector, BLACK, WHITE, EMPTY
+from board_renderer import render_board, render_screen, random_game, game_grid
+from game_recorder import GameRecorder
+from game_session import GameSession
+from gomoku_engine import BUILTIN_BRAIN
+from move_watcher import MoveWatcher
+from papergames_manager import PapergamesManager
+from piskvork_manager import PiskvorkManager
+from screen_capture import CaptureBackend, ReplayBackend, ScreenCapture
+from tracing import TRACER
+
+SCREEN_SIZE = (1920, 1080)
+# Large enough for the biggest board at the highest DPI scale
+LOCATOR_SCREEN_SIZE = (2560, 1440)
+BOARD_LEFT_TOP = (400, 100)
+BOARD_WIDTHS = (480, 640, 800)
+DPI_SCALES = (1.0, 1.25, 1.5)
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {'p50': 0.0, 'p90': 0.0, 'p99': 0.0, 'max': 0.0}
+
+    return {
+        'p50': float(np.percentile(values, 50)),
+        'p90': float(np.percentile(values, 90)),
+        'p99': float(np.percentile(values, 99)),
+        'max': float(np.max(values))
+    }
+
+
+def synthetic_cases(polls_per_move: int):
+    # A game played out on every board size and DPI scale, each position polled several times like a real watcher
+    moves = random_game(60)
+
+    for board_width in BOARD_WIDTHS:
+        for dpi_scale in DPI_SCALES:
+            square_size = board_width * dpi_scale / 16
+            boards = [
+                render_board(game_grid(moves[:ply]), moves[ply - 1], square_size) for ply in range(1, len(moves) + 1)
+            ]
+
+            yield {
+                'name': f"{board_width}px@{dpi_scale:g}x",
+                'frames': [board for board in boards for _ in range(polls_per_move)],
+                'bbox': (0, 0, boards[0].shape[1], boards[0].shape[0])
+            }
+
+
+def corpus_cases(corpus: Path) -> list:
+    # Recorded screenshots, each with a JSON sidecar holding the board corners: {"left_top": [x, y],
+    # "right_bottom": [x, y]}. Labelled datasets from detector_dataset.py use the same sidecars.
+    cases = []
+
+    for screenshot in sorted(corpus.glob('*.png')):
+        with open(screenshot.with_suffix('.json'), 'r') as f:
+            corners = json.load(f)
+
+        cases.append({
+            'name': screenshot.stem,
+            'frames': [np.asarray(Image.open(screenshot).convert('L'))],
+            'bbox': (*corners['left_top'], *corners['right_bottom'])
+        })
+
+    return cases
+
+
+def benchmark_detector(case: dict, incremental: bool, polls: int) -> dict:
+    square_size = (case['bbox'][2] - case['bbox'][0]) / 16
+    detector = IncrementalBoardDetector(square_size) if incremental else BoardDetector(square_size)
+    screen_capture = ScreenCapture(ReplayBackend(case['frames']), case['bbox'])
+
+    latencies = []
+    for i in range(polls):
+        poll_start = time.perf_counter()
+        detector.detect(screen_capture.tick())
+        latencies.append(time.perf_counter() - poll_start)
+
+    # Allocations are counted in a separate pass, tracing slows every allocation down
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    allocated_start, _ = tracemalloc.get_traced_memory()
+    for i in range(polls):
+        detector.detect(screen_capture.tick())
+    _, allocated_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'case': case['name'],
+        'detector': 'incremental' if incremental else 'full',
+        'polls': polls,
+        'latency': percentiles(latencies),
+        'peak_allocated_bytes': allocated_peak - allocated_start
+    }
+
+
+def benchmark_locator(logger: logging.Logger, repeats: int) -> list:
+    locator = BoardLocator(logger)
+    moves = random_game(40)
+
+    results = []
+    for board_width in BOARD_WIDTHS:
+        for dpi_scale in DPI_SCALES:
+            square_size = board_width * dpi_scale / 16
+            screen = render_screen(game_grid(moves), moves[-1], square_size, LOCATOR_SCREEN_SIZE, BOARD_LEFT_TOP)
+            size = int(round(square_size * 16))
+            expected = (*BOARD_LEFT_TOP, BOARD_LEFT_TOP[0] + size, BOARD_LEFT_TOP[1] + size)
+
+            latencies = []
+            location = None
+            for i in range(repeats):
+                locate_start = time.perf_counter()
+                location = locator.locate(screen)
+                latencies.append(time.perf_counter() - locate_start)
+
+            results.append({
+                'case': f"{board_width}px@{dpi_scale:g}x",
+                'latency': percentiles(latencies),
+                'found': location is not None,
+                'corner_error': None if location is None else max(
+                    abs(found - corner) for found, corner in zip((*location.left_top, *location.right_bottom), expected)
+                )
+            })
+
+    return results
+
+
+class SimulatedScreen(CaptureBackend):
+    def __init__(self, square_size: float):
+        self.square_size = square_size
+        self.grid = np.zeros((15, 15), dtype=np.int8)
+        self.last_move = (-1, -1)
+
+        self._lock = threading.Lock()
+        self._frame = None
+
+    def place(self, x: int, y: int, color: int):
+        with self._lock:
+            self.grid[x, y] = color
+            self.last_move = (x, y)
+            self._frame = None
+
+    def grab(self, bbox: tuple[int, int, int, int], out: np.ndarray):
+        with self._lock:
+            if self._frame is None:
+                self._frame = render_screen(
+                    self.grid, self.last_move, self.square_size, SCREEN_SIZE, BOARD_LEFT_TOP
+                )
+
+            np.copyto(out, self._frame[bbox[1]:bbox[3], bbox[0]:bbox[2]])
+
+
+class ScriptedOpponent:
+    # Stands in for papergames.io: places our stone where we click, then answers after a fixed delay
+    def __init__(self, screen: SimulatedScreen, reply_delay: float, seed: int = 0):
+        self.screen = screen
+        self.reply_delay = reply_delay
+        self.rng = np.random.default_rng(seed)
+
+        self.position = (0, 0)
+        self.reply_times = []
+        self.click_times = []
+
+    def click(self):
+        x = int(round((self.position[0] - BOARD_LEFT_TOP[0]) / self.screen.square_size)) - 1
+        y = int(round((self.position[1] - BOARD_LEFT_TOP[1]) / self.screen.square_size)) - 1
+        if not (0 <= x < 15 and 0 <= y < 15) or self.screen.grid[x, y] != EMPTY:
+            return
+
+        self.click_times.append(time.monotonic())
+        self.screen.place(x, y, BLACK)
+        threading.Timer(self.reply_delay, self._reply).start()
+
+    def _reply(self):
+        empty = np.argwhere(self.screen.grid == EMPTY)
+        distance = np.abs(empty - 7).sum(axis=1) + self.rng.random(len(empty))
+        x, y = empty[np.argmin(distance)]
+
+        self.reply_times.append(time.monotonic())
+        self.screen.place(int(x), int(y), WHITE)
+
+
+def stub_brain_launcher(directory: Path, think_time: float) -> Path:
+    # PiskvorkManager runs a single executable, so the stub brain gets a small launcher script
+    stub_brain = Path(__file__).resolve().with_name('stub_brain.py')
+
+    if sys.platform == 'win32':
+        launcher = directory / 'stub_brain.bat'
+        launcher.write_text(f'@"{sys.executable}" "{stub_brain}" --think-time {think_time}\r\n')
+    else:
+        launcher = directory / 'stub_brain.sh'
+        launcher.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{stub_brain}" --think-time {think_time}\n')
+        launcher.chmod(launcher.stat().st_mode | stat.S_IXUSR)
+
+    return launcher
+
+
+def benchmark_game_loop(logger: logging.Logger, moves: int, think_time: float, reply_delay: float,
+                        recorder: GameRecorder = None, builtin_brain: bool = False) -> dict:
+    square_size = 640 / 16
+    screen = SimulatedScreen(square_size)
+    opponent = ScriptedOpponent(screen, reply_delay)
+
+    size = int(round(square_size * 16))
+    papergames_manager = PapergamesManager(
+        logger,
+        BOARD_LEFT_TOP,
+        (BOARD_LEFT_TOP[0] + size, BOARD_LEFT_TOP[1] + size),
+        capture_backend=screen,
+        mouse=opponent
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        if builtin_brain:
+            # The built-in engine searches for the whole thinking time
+            piskvork_manager = PiskvorkManager(logger, Path(BUILTIN_BRAIN), think_time)
+        else:
+            piskvork_manager = PiskvorkManager(logger, stub_brain_launcher(Path(directory), think_time), 0)
+        if piskvork_manager.proc is None:
+            raise RuntimeError('Brain failed to start.')
+
+        move_watcher = MoveWatcher(logger, papergames_manager)
+        move_watcher.start()
+
+        game_session = GameSession(
+            logger,
+            papergames_manager,
+            piskvork_manager,
+            move_watcher,
+            0,
+            True,
+            lambda: len(opponent.click_times) <= moves,
+            recorder=recorder
+        )
+
+        TRACER.reset()
+        start_time = time.monotonic()
+        game_session.run()
+        elapsed = time.monotonic() - start_time
+
+        move_watcher.stop()
+        piskvork_manager.kill()
+
+    # Every click after the first answers the opponent reply before it
+    end_to_end = [click - reply for reply, click in zip(opponent.reply_times, opponent.click_times[1:])]
+
+    return {
+        'moves': len(end_to_end),
+        'think_time': think_time,
+        'end_to_end_latency': percentiles(end_to_end),
+        'detect_to_click_latency': percentiles(game_session.move_latencies),
+        'seconds_per_move': elapsed / max(len(opponent.click_times), 1),
+        'watcher': move_watcher.stats(),
+        'stages': TRACER.summary()
+    }
+
+
+def print_detector_result(result: dict):
+    latency = result['latency']
+    print(
+        f"{result['case']:>16} {result['detector']:>11} "
+        f"p50 {latency['p50'] * 1e6:8.1f} us  p90 {latency['p90'] * 1e6:8.1f} us  "
+        f"p99 {latency['p99'] * 1e6:8.1f} us  max {latency['max'] * 1e6:8.1f} us  "
+        f"peak alloc {result['peak_allocated_bytes'] / 1024:8.1f} KiB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark of the detection and game loop pipeline.')
+    parser.add_argument('--corpus', type=Path, help='directory of recorded screenshots with JSON corner sidecars')
+    parser.add_argument('--polls', type=int, default=600, help='polls per detector case')
+    parser.add_argument('--polls-per-move', type=int, default=10, help='synthetic polls of every position')
+    parser.add_argument('--locate-repeats', type=int, default=10, help='runs of the board locator per case, 0 to skip')
+    parser.add_argument('--game-moves', type=int, default=10, help='moves of the game loop benchmark, 0 to skip')
+    parser.add_argument('--think-time', type=float, default=0.05, help='stub brain thinking time')
+    parser.add_argument('--builtin-brain', action='store_true', help='play the game loop with the built-in engine')
+    parser.add_argument('--reply-delay', type=float, default=0.2, help='scripted opponent thinking time')
+    parser.add_argument('--json', type=Path, help='write the results to this file')
+    parser.add_argument('--record', type=Path, help='append the game loop benchmark game to this recording')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logger = logging.getLogger('benchmark')
+
+    results = {'detector': [], 'locator': [], 'game_loop': None}
+
+    cases = corpus_cases(args.corpus) if args.corpus is not None else synthetic_cases(args.polls_per_move)
+    for case in cases:
+        for incremental in (False, True):
+            result = benchmark_detector(case, incremental, args.polls)
+            results['detector'].append(result)
+            print_detector_result(result)
+
+    if args.locate_repeats > 0:
+        results['locator'] = benchmark_locator(logger, args.locate_repeats)
+        for result in results['locator']:
+            print(
+                f"{result['case']:>16}     locator p50 {result['latency']['p50'] * 1000:8.1f} ms  "
+                f"max {result['latency']['max'] * 1000:8.1f} ms  "
+                + (f"corner error {result['corner_error']} px" if result['found'] else 'not found')
+            )
+
+    if args.game_moves > 0:
+        recorder = GameRecorder(logger, args.record) if args.record is not None else None
+        result = benchmark_game_loop(
+            logger, args.game_moves, args.think_time, args.reply_delay, recorder, args.builtin_brain
+        )
+        if recorder is not None:
+            recorder.close()
+        results['game_loop'] = result
+
+        latency = result['end_to_end_latency']
+        print(
+            f"Game loop: {result['moves']} moves, end-to-end p50 {latency['p50'] * 1000:.1f} ms, "
+            f"p90 {latency['p90'] * 1000:.1f} ms, max {latency['max'] * 1000:.1f} ms, "
+            f"{result['seconds_per_move']:.2f} s per move"
+        )
+        print(TRACER.format_summary())
+
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
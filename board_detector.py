@@ -0,0 +1,179 @@
+import numpy as np
+
+BOARD_SIZE = 15
+
+EMPTY = 0
+BLACK = 1
+WHITE = 2
+
+# How much darker than the board a grid line has to be
+LINE_TOLERANCE = 20
+
+
+class BoardState:
+    def __init__(self, grid: np.ndarray, last_move_mask: np.ndarray):
+        # Both arrays are indexed [x, y], the same way as piskvork coordinates
+        self.grid = grid
+        self.last_move_mask = last_move_mask
+
+    @property
+    def last_move(self) -> tuple[int, int]:
+        xs, ys = np.nonzero(self.last_move_mask)
+        if len(xs) == 0:
+            return -1, -1
+
+        return int(xs[0]), int(ys[0])
+
+    def stones(self, color: int) -> list[tuple[int, int]]:
+        xs, ys = np.nonzero(self.grid == color)
+        return [(int(x), int(y)) for x, y in zip(xs, ys)]
+
+
+class BoardDetector:
+    def __init__(self, square_size: float, threshold: int = 200, stone_tolerance: int = 40):
+        self.square_size = square_size
+        self.threshold = threshold
+        self.stone_tolerance = stone_tolerance
+
+        indices = np.arange(BOARD_SIZE)
+
+        # Intersection centre and the last move marker probe, as used by the original pixel scan, followed by
+        # four stone probes on the diagonals, so grid lines never fall under them
+        probes = [self._probe(indices + 1 + dx, indices + 1 + dy) for dx, dy in (
+            (0.0, 0.0), (0.2, 0.2), (-0.25, -0.25), (0.25, -0.25), (-0.25, 0.25), (0.25, 0.25)
+        )]
+        self._cell_probe = (np.stack([rows for rows, _ in probes]), np.stack([columns for _, columns in probes]))
+
+        # Centres of the squares are never covered by a stone and give the board colour
+        squares = np.arange(BOARD_SIZE + 1) + 0.5
+        self._background_probe = self._probe(squares, squares)
+
+        # Grid lines halfway between two intersections, also never covered by a stone. Each point is sampled on the
+        # line and one pixel to either side of it, so a line that is off by a pixel still counts.
+        lines = indices + 1.0
+        vertical_rows, vertical_columns = self._probe(lines, squares[1:-1])
+        horizontal_rows, horizontal_columns = self._probe(squares[1:-1], lines)
+        self._line_probes = (
+            [(vertical_rows, vertical_columns + shift) for shift in (-1, 0, 1)],
+            [(horizontal_rows + shift, horizontal_columns) for shift in (-1, 0, 1)]
+        )
+
+    def _probe(self, x_positions: np.ndarray, y_positions: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        columns, rows = np.meshgrid(
+            (x_positions * self.square_size).astype(np.intp),
+            (y_positions * self.square_size).astype(np.intp),
+            indexing='ij'
+        )
+
+        # Row and column index arrays for a [y, x] image, laid out as [x, y]
+        return rows, columns
+
+    def _sample(self, gray: np.ndarray) -> tuple[np.ndarray, float]:
+        return gray[self._cell_probe].astype(np.int16), float(np.median(gray[self._background_probe]))
+
+    def _classify(self, samples: np.ndarray, background: float) -> tuple[np.ndarray, np.ndarray]:
+        last_move_mask = (samples[0] > self.threshold) & (samples[1] <= self.threshold)
+
+        stone = samples[2:].mean(axis=0)
+        grid = np.full(stone.shape, EMPTY, dtype=np.int8)
+        grid[stone < background - self.stone_tolerance] = BLACK
+        grid[stone > background + self.stone_tolerance] = WHITE
+
+        return grid, last_move_mask
+
+    def detect(self, gray: np.ndarray) -> BoardState:
+        return BoardState(*self._classify(*self._sample(gray)))
+
+    def grid_confidence(self, gray: np.ndarray) -> float:
+        # Share of the grid line points that are darker than the board, low when the board moved or was zoomed
+        background = float(np.median(gray[self._background_probe]))
+        darkest = [np.minimum.reduce([gray[probe] for probe in probes]) for probes in self._line_probes]
+
+        return float(np.mean([(line < background - LINE_TOLERANCE).mean() for line in darkest]))
+
+    def cell_bbox(self, x: int, y: int) -> tuple[int, int, int, int]:
+        # The part of the board image holding the probes of one intersection and the centres of the four squares
+        # around it, which give the board colour
+        return (
+            int((x + 0.5) * self.square_size),
+            int((y + 0.5) * self.square_size),
+            int((x + 1.5) * self.square_size) + 1,
+            int((y + 1.5) * self.square_size) + 1
+        )
+
+    def detect_cell(self, patch: np.ndarray, x: int, y: int) -> tuple[int, bool]:
+        # Colour of a single intersection and whether it holds the last move marker, from a cell_bbox crop
+        left, top, _, _ = self.cell_bbox(x, y)
+
+        samples = patch[self._cell_probe[0][:, x, y] - top, self._cell_probe[1][:, x, y] - left].astype(np.int16)
+        background = float(np.median(patch[
+            self._background_probe[0][x:x + 2, y:y + 2] - top, self._background_probe[1][x:x + 2, y:y + 2] - left
+        ]))
+
+        grid, last_move_mask = self._classify(samples[:, np.newaxis], background)
+        return int(grid[0]), bool(last_move_mask[0])
+
+
+class IncrementalBoardDetector(BoardDetector):
+    # Classifies only intersections whose probes changed since the last frame. Sampling the probes is most of the
+    # cost of a detection, so this is not faster than BoardDetector, and it is not used by default.
+    def __init__(
+            self,
+            square_size: float,
+            threshold: int = 200,
+            stone_tolerance: int = 40,
+            change_tolerance: int = 24,
+            max_changed_cells: int = 4
+    ):
+        super().__init__(square_size, threshold, stone_tolerance)
+
+        self.change_tolerance = change_tolerance
+        self.max_changed_cells = max_changed_cells
+
+        self.full_scans = 0
+        self.incremental_scans = 0
+
+        self._previous_samples = None
+        self._previous_background = None
+        self._board_state = None
+
+    def reset(self):
+        self._previous_samples = None
+        self._previous_background = None
+        self._board_state = None
+
+    def detect(self, gray: np.ndarray) -> BoardState:
+        samples, background = self._sample(gray)
+
+        # A new board colour means the page scrolled or changed theme, so nothing from the last frame can be trusted
+        if self._previous_samples is None or abs(background - self._previous_background) > self.change_tolerance:
+            return self._full_scan(samples, background)
+
+        changed = (np.abs(samples - self._previous_samples) > self.change_tolerance).any(axis=0)
+        changed_count = int(changed.sum())
+
+        if changed_count > self.max_changed_cells:
+            return self._full_scan(samples, background)
+
+        self.incremental_scans += 1
+
+        if changed_count == 0:
+            return self._board_state
+
+        grid = self._board_state.grid.copy()
+        last_move_mask = self._board_state.last_move_mask.copy()
+        grid[changed], last_move_mask[changed] = self._classify(samples[:, changed], self._previous_background)
+
+        self._previous_samples[:, changed] = samples[:, changed]
+        self._board_state = BoardState(grid, last_move_mask)
+
+        return self._board_state
+
+    def _full_scan(self, samples: np.ndarray, background: float) -> BoardState:
+        self.full_scans += 1
+
+        self._previous_samples = samples
+        self._previous_background = background
+        self._board_state = BoardState(*self._classify(samples, background))
+
+        return self._board_state
@@ -0,0 +1,181 @@
+import logging
+from typing import Optional
+
+import numpy as np
+
+from board_detector import BOARD_SIZE
+
+LINES = BOARD_SIZE
+TEETH = np.arange(LINES)
+
+
+class BoardLocation:
+    def __init__(self, left_top: tuple[int, int], right_bottom: tuple[int, int], square_size: float,
+                 confidence: float):
+        # Corners in the same convention as the hand set ones: the bbox spans 16 squares around the 15 lines
+        self.left_top = left_top
+        self.right_bottom = right_bottom
+        self.square_size = square_size
+        self.confidence = confidence
+
+
+def line_profile(image: np.ndarray, distance: int, tolerance: int) -> np.ndarray:
+    # For every column, how many of its pixels belong to a thin dark vertical line: darker than both neighbours
+    # `distance` pixels away. Stones and other blobs are dark on at least one side and do not count.
+    image = image.astype(np.int16)
+    centre = image[:, distance:-distance]
+    dark = (centre < image[:, :-2 * distance] - tolerance) & (centre < image[:, 2 * distance:] - tolerance)
+
+    profile = np.zeros(image.shape[1], dtype=np.float64)
+    profile[distance:-distance] = dark.sum(axis=0)
+
+    return profile
+
+
+def min_pool(image: np.ndarray, factor: int) -> np.ndarray:
+    # Thin dark lines survive the downscale, where plain subsampling would step over them
+    height, width = image.shape[0] // factor * factor, image.shape[1] // factor * factor
+    image = image[:height, :width]
+
+    # Rows first, then columns, each as a few whole array minimums, which is much faster than a reduction over a
+    # reshaped block axis
+    rows = image[0::factor].copy()
+    for i in range(1, factor):
+        np.minimum(rows, image[i::factor], out=rows)
+
+    pooled = rows[:, 0::factor].copy()
+    for i in range(1, factor):
+        np.minimum(pooled, rows[:, i::factor], out=pooled)
+
+    return pooled
+
+
+def comb_search(profile: np.ndarray, min_pitch: float, max_pitch: float, pitch_step: float,
+                offsets: np.ndarray = None) -> tuple[float, float, float]:
+    # Evenly spaced lines, as (pitch, offset of the first line, mean profile under the teeth)
+    smoothed = np.convolve(profile, np.ones(3), mode='same')
+
+    best = (0.0, 0.0, -1.0)
+    for pitch in np.arange(min_pitch, max_pitch + pitch_step / 2, pitch_step):
+        span = (LINES - 1) * pitch
+        candidates = offsets if offsets is not None else np.arange(0, len(smoothed) - span - 1)
+        candidates = candidates[(candidates >= 0) & (candidates + span < len(smoothed) - 1)]
+        if len(candidates) == 0:
+            continue
+
+        teeth = np.rint(candidates[:, np.newaxis] + TEETH * pitch).astype(np.intp)
+        scores = smoothed[teeth].sum(axis=1) / LINES
+
+        index = int(np.argmax(scores))
+        if scores[index] > best[2]:
+            best = (float(pitch), float(candidates[index]), float(scores[index]))
+
+    return best
+
+
+def refine_lines(profile: np.ndarray, pitch: float, offset: float, window: int) -> tuple[float, float, float]:
+    # Centre of every line near where the comb put it, and a least squares fit of pitch and offset through them.
+    # Confidence is the share of lines that really showed up.
+    centres = []
+    strengths = []
+    for k in TEETH:
+        expected = int(round(offset + k * pitch))
+        low, high = max(expected - window, 0), min(expected + window + 1, len(profile))
+        weights = profile[low:high]
+
+        strengths.append(weights.sum())
+        centres.append(np.dot(weights, np.arange(low, high)) / weights.sum() if weights.sum() > 0 else expected)
+
+    strengths = np.array(strengths)
+    found = strengths > 0.3 * np.median(strengths) if np.median(strengths) > 0 else np.zeros(LINES, dtype=bool)
+    if found.sum() < 2:
+        return pitch, offset, 0.0
+
+    fitted_pitch, fitted_offset = np.polyfit(TEETH[found], np.array(centres)[found], 1)
+    return float(fitted_pitch), float(fitted_offset), float(found.mean())
+
+
+class BoardLocator:
+    def __init__(
+            self,
+            logger: logging.Logger,
+            factor: int = 4,
+            min_square_size: float = 12.0,
+            line_tolerance: int = 20,
+            min_confidence: float = 0.8
+    ):
+        self.logger = logger
+        self.factor = factor
+        self.min_square_size = min_square_size
+        self.line_tolerance = line_tolerance
+        self.min_confidence = min_confidence
+
+    def locate(self, gray: np.ndarray, origin: tuple[int, int] = (0, 0)) -> Optional[BoardLocation]:
+        # Coarse to fine: find the pitch and position of the 15 lines on a min pooled image, then fit them at full
+        # resolution inside the area found
+        pooled = min_pool(gray, self.factor)
+        max_pitch = min(pooled.shape) / (LINES + 1)
+        min_pitch = max(self.min_square_size / self.factor, 2.0)
+        if max_pitch < min_pitch:
+            return None
+
+        coarse_x = comb_search(line_profile(pooled, 2, self.line_tolerance), min_pitch, max_pitch, 0.25)
+        coarse_y = comb_search(line_profile(pooled.T, 2, self.line_tolerance), min_pitch, max_pitch, 0.25)
+        if coarse_x[2] <= 0 or coarse_y[2] <= 0:
+            return None
+
+        # The full resolution search only looks at the area the coarse search found
+        pad = 4 * self.factor
+        top = max(int(coarse_y[1] * self.factor) - pad, 0)
+        bottom = int((coarse_y[1] + (LINES - 1) * coarse_y[0] + 1) * self.factor) + pad
+        left = max(int(coarse_x[1] * self.factor) - pad, 0)
+        right = int((coarse_x[1] + (LINES - 1) * coarse_x[0] + 1) * self.factor) + pad
+        area = gray[top:bottom, left:right]
+
+        distance = max(2, int(coarse_x[0] * self.factor / 16))
+        pitch_x, offset_x, confidence_x = self._fine(
+            line_profile(area, distance, self.line_tolerance), coarse_x[0], coarse_x[1] - left / self.factor
+        )
+        pitch_y, offset_y, confidence_y = self._fine(
+            line_profile(area.T, distance, self.line_tolerance), coarse_y[0], coarse_y[1] - top / self.factor
+        )
+        offset_x += left
+        offset_y += top
+        confidence = min(confidence_x, confidence_y)
+
+        # Squares are square, a large difference means the two searches locked on different things
+        if abs(pitch_x - pitch_y) > 0.05 * max(pitch_x, pitch_y):
+            confidence = 0.0
+
+        square_size = (pitch_x + pitch_y) / 2
+        location = BoardLocation(
+            (int(round(origin[0] + offset_x - square_size)), int(round(origin[1] + offset_y - square_size))),
+            (
+                int(round(origin[0] + offset_x + LINES * square_size)),
+                int(round(origin[1] + offset_y + LINES * square_size))
+            ),
+            square_size,
+            confidence
+        )
+
+        self.logger.debug(
+            f"Board located at {location.left_top} - {location.right_bottom}, square size {square_size:.2f}, "
+            f"confidence {confidence:.2f}"
+        )
+
+        if confidence < self.min_confidence:
+            return None
+
+        return location
+
+    def _fine(self, profile: np.ndarray, pitch: float, offset: float) -> tuple[float, float, float]:
+        # The coarse pitch is only known to a pooled pixel, which adds up over 14 squares
+        pitch, offset, _ = comb_search(
+            profile,
+            (pitch - 1) * self.factor,
+            (pitch + 1) * self.factor,
+            0.25,
+            np.arange(int((offset - 1) * self.factor), int((offset + 2) * self.factor) + 1)
+        )
+
+        return refine_lines(profile, pitch, offset, max(2, int(pitch / 8)))
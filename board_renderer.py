@@ -0,0 +1,97 @@
+import numpy as np
+
+from board_detector import BOARD_SIZE, BLACK, WHITE
+
+
+class Theme:
+    def __init__(self, background: int, grid_line: int, black_stone: int, white_stone: int, marker: int):
+        # Gray levels of every part of the board
+        self.background = background
+        self.grid_line = grid_line
+        self.black_stone = black_stone
+        self.white_stone = white_stone
+        self.marker = marker
+
+
+THEMES = {
+    'light': Theme(180, 90, 30, 240, 255),
+    'wood': Theme(150, 70, 20, 235, 250),
+    'dark': Theme(70, 120, 15, 225, 255)
+}
+DEFAULT_THEME = THEMES['light']
+
+
+def render_board(grid: np.ndarray, last_move: tuple[int, int], square_size: float,
+                 theme: Theme = DEFAULT_THEME) -> np.ndarray:
+    # A synthetic grayscale board with the geometry the detector expects: the bbox spans 16 squares, with the
+    # intersections at (x + 1) * square_size, stones of radius 0.4 and the last move marked by a bright dot in a
+    # dark ring
+    size = int(round(square_size * (BOARD_SIZE + 1)))
+    image = np.full((size, size), theme.background, dtype=np.uint8)
+
+    line_width = max(1, int(square_size / 24))
+    for k in range(BOARD_SIZE):
+        position = int((k + 1) * square_size)
+        image[
+            int(square_size):int(BOARD_SIZE * square_size) + line_width, position:position + line_width
+        ] = theme.grid_line
+        image[
+            position:position + line_width, int(square_size):int(BOARD_SIZE * square_size) + line_width
+        ] = theme.grid_line
+
+    rows, columns = np.ogrid[0:size, 0:size]
+
+    def disc(x: int, y: int, radius: float) -> np.ndarray:
+        distance = (columns - (x + 1) * square_size) ** 2 + (rows - (y + 1) * square_size) ** 2
+        return distance <= (radius * square_size) ** 2
+
+    xs, ys = np.nonzero(grid)
+    for x, y in zip(xs, ys):
+        image[disc(x, y, 0.4)] = theme.black_stone if grid[x, y] == BLACK else theme.white_stone
+
+    if last_move != (-1, -1):
+        x, y = last_move
+        image[disc(x, y, 0.3)] = theme.black_stone
+        image[disc(x, y, 0.1)] = theme.marker
+
+    return image
+
+
+def render_screen(
+        grid: np.ndarray,
+        last_move: tuple[int, int],
+        square_size: float,
+        screen_size: tuple[int, int],
+        left_top: tuple[int, int],
+        theme: Theme = DEFAULT_THEME
+) -> np.ndarray:
+    board = render_board(grid, last_move, square_size, theme)
+
+    screen = np.full((screen_size[1], screen_size[0]), 255, dtype=np.uint8)
+    screen[left_top[1]:left_top[1] + board.shape[0], left_top[0]:left_top[0] + board.shape[1]] = board
+
+    return screen
+
+
+def random_game(length: int, seed: int = 0) -> list[tuple[int, int]]:
+    # Plausible looking games: every move lands next to an earlier one
+    rng = np.random.default_rng(seed)
+    moves = [(BOARD_SIZE // 2, BOARD_SIZE // 2)]
+    occupied = set(moves)
+
+    while len(moves) < length:
+        x, y = moves[rng.integers(len(moves))]
+        x, y = x + int(rng.integers(-1, 2)), y + int(rng.integers(-1, 2))
+        if 0 <= x < BOARD_SIZE and 0 <= y < BOARD_SIZE and (x, y) not in occupied:
+            moves.append((x, y))
+            occupied.add((x, y))
+
+    return moves
+
+
+def game_grid(moves: list[tuple[int, int]]) -> np.ndarray:
+    grid = np.zeros((BOARD_SIZE, BOARD_SIZE), dtype=np.int8)
+    for i, (x, y) in enumerate(moves):
+        grid[x, y] = BLACK if i % 2 == 0 else WHITE
+
+    return grid
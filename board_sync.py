@@ -0,0 +1,84 @@
+import logging
+from typing import Optional
+
+import numpy as np
+
+from board_detector import BOARD_SIZE, BLACK, WHITE, EMPTY
+from piskvork_manager import OWN, OPPONENT
+
+
+class BoardSynchronizer:
+    def __init__(self, logger: logging.Logger, own_color: int):
+        self.logger = logger
+        self.own_color = own_color
+        self.opponent_color = WHITE if own_color == BLACK else BLACK
+
+        # Own stones seen on the board right after they were clicked, a resync never drops them
+        self.verified = set()
+
+        self.resyncs = 0
+        self.refused = 0
+
+    def grid(self, moves: list) -> np.ndarray:
+        grid = np.full((BOARD_SIZE, BOARD_SIZE), EMPTY, dtype=np.int8)
+        for x, y, player in moves:
+            grid[x, y] = self.own_color if player == OWN else self.opponent_color
+
+        return grid
+
+    def in_sync(self, moves: list, detected_grid: np.ndarray) -> bool:
+        return bool((self.grid(moves) == detected_grid).all())
+
+    def describe(self, moves: list, detected_grid: np.ndarray) -> str:
+        expected_grid = self.grid(moves)
+        different = detected_grid != expected_grid
+        missing = [(int(x), int(y)) for x, y in np.argwhere((expected_grid != EMPTY) & different)]
+        extra = [(int(x), int(y)) for x, y in np.argwhere((detected_grid != EMPTY) & different)]
+
+        return f"missing {missing}, extra {extra}"
+
+    def verify(self, x: int, y: int):
+        self.verified.add((x, y))
+
+    def refusal(self, detected_grid: np.ndarray, last_move: tuple[int, int]) -> Optional[str]:
+        # Why the detected board cannot be a real position with the opponent to have just moved, None when it can. A
+        # detector that misreads a palette the same way on every frame must not hand the brain a broken board.
+        own = int((detected_grid == self.own_color).sum())
+        opponent = int((detected_grid == self.opponent_color).sum())
+
+        # Black moves first, so on our turn black has as many stones as white, and white one fewer than black
+        expected_own = opponent if self.own_color == BLACK else opponent - 1
+        if own != expected_own:
+            self.refused += 1
+            return f"{own} own and {opponent} opponent stones"
+
+        x, y = last_move
+        if not (0 <= x < BOARD_SIZE and 0 <= y < BOARD_SIZE) or detected_grid[x, y] != self.opponent_color:
+            self.refused += 1
+            return f"last move {last_move} not on the board"
+
+        missing = sorted(move for move in self.verified if detected_grid[move] != self.own_color)
+        if missing:
+            self.refused += 1
+            return f"verified stones {missing} missing"
+
+        return None
+
+    def reconcile(self, moves: list, detected_grid: np.ndarray, last_move: tuple[int, int]) -> list:
+        # Keep the known order for every stone that is really there, then add the stones we never saw, with the
+        # opponent's last move at the end where the brain expects it
+        kept = [
+            (x, y, player) for x, y, player in moves
+            if (x, y) != last_move and detected_grid[x, y] == (self.own_color if player == OWN else self.opponent_color)
+        ]
+        known = {(x, y) for x, y, _ in kept}
+
+        added = [
+            (int(x), int(y), OWN if detected_grid[x, y] == self.own_color else OPPONENT)
+            for x, y in np.argwhere(detected_grid != EMPTY)
+            if (x, y) not in known and (x, y) != last_move
+        ]
+
+        self.resyncs += 1
+
+        return kept + added + [(last_move[0], last_move[1], OPPONENT)]
@@ -0,0 +1,109 @@
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from move_cache import MoveCache
+from opening_book import OpeningBook
+from piskvork_manager import PiskvorkManager
+
+
+class BrainPool:
+    def __init__(self, logger: logging.Logger, pbrain_path: Path, timeout_turn: float, size: int = 1,
+                 ponder: bool = False, move_cache: MoveCache = None, opening_book: OpeningBook = None,
+                 timeout_match: float = 0.0, parallel_paths: list = None):
+        self.logger = logger
+
+        self.pbrain_path = pbrain_path
+        self.timeout_turn = timeout_turn
+        self.timeout_match = timeout_match
+        self.size = size
+        self.ponder = ponder
+        self.move_cache = move_cache
+        self.opening_book = opening_book
+        self.parallel_paths = parallel_paths
+
+        self._condition = threading.Condition()
+        self._idle = []
+        self._busy = []
+        # Brains being restarted or started for a game, outside of the lock so other boards are not held up
+        self._preparing = 0
+
+    def warm_up(self):
+        # Start every brain up front, so no game pays for the startup
+        with self._condition:
+            while len(self._idle) + len(self._busy) < self.size:
+                brain = self._spawn()
+                if brain is None:
+                    return
+
+                self._idle.append(brain)
+
+    def acquire(self, timeout: float = None) -> Optional[PiskvorkManager]:
+        acquire_time = time.monotonic()
+
+        with self._condition:
+            while not self._idle and len(self._busy) + self._preparing >= self.size:
+                if not self._condition.wait(timeout):
+                    self.logger.error('No piskvork brain available.')
+                    return None
+
+            brain = self._idle.pop() if self._idle else None
+            self._preparing += 1
+
+        try:
+            if brain is not None and not self._reset(brain):
+                self.logger.warning('Piskvork brain failed health check, replacing it.')
+                brain.kill()
+                brain = None
+
+            if brain is None:
+                brain = self._spawn()
+        finally:
+            with self._condition:
+                self._preparing -= 1
+                if brain is not None:
+                    self._busy.append(brain)
+                else:
+                    self._condition.notify()
+
+        if brain is None:
+            return None
+
+        # Startup latency is reported from the moment the game asked for a brain
+        brain.start_time = acquire_time
+        return brain
+
+    def release(self, brain: PiskvorkManager):
+        with self._condition:
+            self._busy.remove(brain)
+
+            if brain.is_alive():
+                self._idle.append(brain)
+            else:
+                self.logger.warning('Piskvork brain crashed, dropping it from the pool.')
+
+            self._condition.notify()
+
+    def close(self):
+        with self._condition:
+            for brain in self._idle + self._busy:
+                if brain.is_alive():
+                    brain.kill()
+
+            self._idle = []
+            self._busy = []
+
+    def _reset(self, brain: PiskvorkManager) -> bool:
+        return brain.is_alive() and brain.restart()
+
+    def _spawn(self) -> Optional[PiskvorkManager]:
+        brain = PiskvorkManager(
+            self.logger, self.pbrain_path, self.timeout_turn, self.ponder, move_cache=self.move_cache,
+            opening_book=self.opening_book, timeout_match=self.timeout_match, parallel_paths=self.parallel_paths
+        )
+        if brain.proc is None:
+            return None
+
+        return brain
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from PIL.ImageQt import ImageQt
+from PyQt5 import QtCore, QtGui
+from PyQt5.QtWidgets import QLabel
+
+from board_detector import BoardState
+
+
+class DebugPreview(QtCore.QObject):
+    imageReady = QtCore.pyqtSignal(QtGui.QImage)
+
+    def __init__(self, label: QLabel, max_fps: float = 5.0, width: int = 350, threshold: int = 200):
+        super().__init__()
+
+        self.label = label
+        self.min_frame_interval = 1 / max_fps
+        self.width = width
+        self.threshold = threshold
+
+        # Only rendered while somebody is looking at it
+        self.enabled = False
+
+        self.font = ImageFont.truetype('NotoSans-Regular.ttf', 64)
+
+        self._frame = None
+        self._board_state = None
+        self._last_publish_time = 0.0
+        self._lock = threading.Lock()
+        self._pending = threading.Event()
+        threading.Thread(target=self._render, daemon=True).start()
+
+        # Queued across threads, so the pixmap is only ever touched by the GUI thread
+        self.imageReady.connect(self._show)
+
+    def publish(self, gray: np.ndarray, board_state: BoardState):
+        # Called from the detection hot path: either drop the frame or take a copy, never render here
+        if not self.enabled or time.monotonic() - self._last_publish_time < self.min_frame_interval:
+            return
+
+        self._last_publish_time = time.monotonic()
+
+        with self._lock:
+            if self._frame is None or self._frame.shape != gray.shape:
+                self._frame = np.empty_like(gray)
+            np.copyto(self._frame, gray)
+            self._board_state = board_state
+
+        self._pending.set()
+
+    def _render(self):
+        while True:
+            self._pending.wait()
+            self._pending.clear()
+
+            with self._lock:
+                image = Image.fromarray(np.where(self._frame > self.threshold, 255, 0).astype(np.uint8))
+                board_state = self._board_state
+
+            x, y = board_state.last_move
+            if x != -1:
+                ImageDraw.Draw(image).text((0, 0), f"{x},{y}", fill=0, font=self.font)
+
+            self.imageReady.emit(ImageQt(image).scaledToWidth(self.width, mode=QtCore.Qt.SmoothTransformation))
+
+    def _show(self, image: QtGui.QImage):
+        self.label.setPixmap(QtGui.QPixmap.fromImage(image))
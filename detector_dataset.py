@@ -0,0 +1,284 @@
+import argparse
+import importlib
+import json
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from board_detector import BOARD_SIZE, BLACK, WHITE, EMPTY, BoardDetector
+from board_renderer import THEMES, game_grid, random_game, render_screen
+
+# Grids are stored as one string per row, y going down and x going right like on screen
+CELL_CHARS = {EMPTY: '.', BLACK: 'X', WHITE: 'O'}
+CHAR_CELLS = {char: cell for cell, char in CELL_CHARS.items()}
+
+SCREEN_SIZE = (2560, 1440)
+BOARD_WIDTHS = (480, 640, 800)
+DPI_SCALES = (1.0, 1.25, 1.5)
+
+
+class Sample:
+    def __init__(self, name: str, image: np.ndarray, bbox: tuple[int, int, int, int], grid: Optional[np.ndarray],
+                 last_move: Optional[tuple[int, int]], tags: dict = None):
+        # A screenshot with the board corners, and when it is labelled the stones, indexed [x, y], and the position
+        # of the last move marker, None when no stone is marked
+        self.name = name
+        self.image = image
+        self.bbox = bbox
+        self.grid = grid
+        self.last_move = last_move
+        self.tags = tags if tags is not None else {}
+
+    @property
+    def labelled(self) -> bool:
+        return self.grid is not None
+
+
+def grid_to_rows(grid: np.ndarray) -> list[str]:
+    return [''.join(CELL_CHARS[int(grid[x, y])] for x in range(BOARD_SIZE)) for y in range(BOARD_SIZE)]
+
+
+def rows_to_grid(rows: list[str]) -> np.ndarray:
+    grid = np.zeros((BOARD_SIZE, BOARD_SIZE), dtype=np.int8)
+    for y, row in enumerate(rows):
+        for x, char in enumerate(row):
+            grid[x, y] = CHAR_CELLS[char]
+
+    return grid
+
+
+def write_sample(directory: Path, sample: Sample):
+    # The sidecar is a superset of the benchmark corpus format, so a dataset is also a corpus
+    Image.fromarray(sample.image).save(directory / f"{sample.name}.png")
+
+    sidecar = {'left_top': list(sample.bbox[:2]), 'right_bottom': list(sample.bbox[2:])}
+    if sample.labelled:
+        sidecar['grid'] = grid_to_rows(sample.grid)
+        sidecar['last_move'] = list(sample.last_move) if sample.last_move is not None else None
+    sidecar['tags'] = sample.tags
+
+    with open(directory / f"{sample.name}.json", 'w') as f:
+        json.dump(sidecar, f, indent=4)
+
+
+def read_sample(screenshot: Path) -> Sample:
+    with open(screenshot.with_suffix('.json'), 'r') as f:
+        sidecar = json.load(f)
+
+    return Sample(
+        screenshot.stem,
+        np.asarray(Image.open(screenshot).convert('L')),
+        (*sidecar['left_top'], *sidecar['right_bottom']),
+        rows_to_grid(sidecar['grid']) if 'grid' in sidecar else None,
+        tuple(sidecar['last_move']) if sidecar.get('last_move') is not None else None,
+        sidecar.get('tags')
+    )
+
+
+def read_dataset(directory: Path) -> list[Sample]:
+    return [read_sample(screenshot) for screenshot in sorted(directory.glob('*.png'))]
+
+
+def generate_samples(positions: int, noise: float = 0.0, seed: int = 0):
+    # Rendered screens of random positions on every theme, board size and DPI scale, at varying places on screen
+    rng = np.random.default_rng(seed)
+
+    for theme_name, theme in THEMES.items():
+        for board_width in BOARD_WIDTHS:
+            for dpi_scale in DPI_SCALES:
+                square_size = board_width * dpi_scale / 16
+                size = int(round(square_size * 16))
+
+                for i in range(positions):
+                    moves = random_game(int(rng.integers(1, 80)), seed=int(rng.integers(1 << 31)))
+                    left_top = (
+                        int(rng.integers(0, SCREEN_SIZE[0] - size)), int(rng.integers(0, SCREEN_SIZE[1] - size))
+                    )
+                    # Some frames are taken between the click and the marker moving, so no stone is marked
+                    last_move = moves[-1] if rng.random() > 0.1 else None
+
+                    image = render_screen(
+                        game_grid(moves), last_move if last_move is not None else (-1, -1), square_size, SCREEN_SIZE,
+                        left_top, theme
+                    )
+                    if noise > 0:
+                        image = np.clip(image + rng.normal(0, noise, image.shape), 0, 255).astype(np.uint8)
+
+                    yield Sample(
+                        f"{theme_name}-{board_width}px@{dpi_scale:g}x-{i:03}",
+                        image,
+                        (*left_top, left_top[0] + size, left_top[1] + size),
+                        game_grid(moves),
+                        last_move,
+                        {'theme': theme_name, 'board_width': board_width, 'dpi_scale': dpi_scale, 'noise': noise}
+                    )
+
+
+def load_detector(spec: str):
+    # A detector class as module:Class, built with the square size like BoardDetector
+    module_name, _, class_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def score_sample(detector, sample: Sample, repeats: int) -> dict:
+    left, top, right, bottom = sample.bbox
+    gray = np.ascontiguousarray(sample.image[top:bottom, left:right])
+
+    # Best of several runs, the first one pays for caches warming up
+    frame_times = []
+    board_state = None
+    for i in range(repeats):
+        if hasattr(detector, 'reset'):
+            detector.reset()
+
+        detect_start = time.perf_counter()
+        board_state = detector.detect(gray)
+        frame_times.append(time.perf_counter() - detect_start)
+
+    truth, detected = sample.grid, board_state.grid
+    last_move = board_state.last_move if board_state.last_move != (-1, -1) else None
+
+    return {
+        'sample': sample.name,
+        'tags': sample.tags,
+        'cells_wrong': int((detected != truth).sum()),
+        'stones': int((truth != EMPTY).sum()),
+        'empty': int((truth == EMPTY).sum()),
+        # Stones seen on empty intersections, stones missed, and stones seen in the wrong colour
+        'false_stones': int(((truth == EMPTY) & (detected != EMPTY)).sum()),
+        'missed_stones': int(((truth != EMPTY) & (detected == EMPTY)).sum()),
+        'wrong_colour': int(((truth != EMPTY) & (detected != EMPTY) & (detected != truth)).sum()),
+        'marked': sample.last_move is not None,
+        'last_move_correct': last_move == sample.last_move,
+        # A marker reported where there is none, or at another intersection
+        'false_last_move': last_move is not None and last_move != sample.last_move,
+        'frame_time': float(min(frame_times))
+    }
+
+
+def summarize(results: list[dict]) -> dict:
+    if not results:
+        return {}
+
+    frame_times = [result['frame_time'] for result in results]
+    stones = sum(result['stones'] for result in results)
+    empty = sum(result['empty'] for result in results)
+
+    return {
+        'samples': len(results),
+        'board_accuracy': float(np.mean([result['cells_wrong'] == 0 for result in results])),
+        'cell_accuracy': (
+            1 - sum(result['cells_wrong'] for result in results) / (BOARD_SIZE * BOARD_SIZE * len(results))
+        ),
+        'false_stone_rate': sum(result['false_stones'] for result in results) / empty if empty else 0.0,
+        'missed_stone_rate': sum(result['missed_stones'] for result in results) / stones if stones else 0.0,
+        'wrong_colour_rate': sum(result['wrong_colour'] for result in results) / stones if stones else 0.0,
+        'last_move_accuracy': float(np.mean([result['last_move_correct'] for result in results])),
+        'false_last_move_rate': float(np.mean([result['false_last_move'] for result in results])),
+        'frame_time_p50': float(np.percentile(frame_times, 50)),
+        'frame_time_p90': float(np.percentile(frame_times, 90)),
+        'frame_time_max': float(np.max(frame_times))
+    }
+
+
+def score(samples: list[Sample], detector_class, repeats: int = 5, group_by: str = None) -> dict:
+    results = []
+    for sample in samples:
+        if not sample.labelled:
+            continue
+
+        detector = detector_class((sample.bbox[2] - sample.bbox[0]) / 16)
+        results.append(score_sample(detector, sample, repeats))
+
+    scores = {'overall': summarize(results), 'groups': {}, 'samples': results}
+    if group_by is not None:
+        for value in sorted({str(result['tags'].get(group_by)) for result in results}):
+            scores['groups'][value] = summarize(
+                [result for result in results if str(result['tags'].get(group_by)) == value]
+            )
+
+    return scores
+
+
+def format_summary(name: str, summary: dict) -> str:
+    return (
+        f"{name:>16} {summary['samples']:5} samples  boards {summary['board_accuracy'] * 100:6.2f}%  "
+        f"cells {summary['cell_accuracy'] * 100:7.3f}%  false stones {summary['false_stone_rate'] * 100:6.3f}%  "
+        f"missed {summary['missed_stone_rate'] * 100:6.3f}%  colour {summary['wrong_colour_rate'] * 100:6.3f}%  "
+        f"last move {summary['last_move_accuracy'] * 100:6.2f}% (false {summary['false_last_move_rate'] * 100:5.2f}%)  "
+        f"p50 {summary['frame_time_p50'] * 1e6:7.1f} us  max {summary['frame_time_max'] * 1e6:7.1f} us"
+    )
+
+
+def label(screenshot: Path, left_top: tuple[int, int], right_bottom: tuple[int, int]):
+    # Writes a sidecar with what the current detector sees, to be checked and corrected by hand
+    image = np.asarray(Image.open(screenshot).convert('L'))
+    detector = BoardDetector((right_bottom[0] - left_top[0]) / 16)
+    board_state = detector.detect(image[left_top[1]:right_bottom[1], left_top[0]:right_bottom[0]])
+    last_move = board_state.last_move
+
+    with open(screenshot.with_suffix('.json'), 'w') as f:
+        json.dump({
+            'left_top': list(left_top),
+            'right_bottom': list(right_bottom),
+            'grid': grid_to_rows(board_state.grid),
+            'last_move': list(last_move) if last_move != (-1, -1) else None,
+            'tags': {}
+        }, f, indent=4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Labelled board screenshots for measuring board detectors.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    generate_parser = subparsers.add_parser('generate', help='render a synthetic dataset')
+    generate_parser.add_argument('directory', type=Path, help='directory to write the samples to')
+    generate_parser.add_argument('--positions', type=int, default=5, help='positions per theme, size and DPI scale')
+    generate_parser.add_argument('--noise', type=float, default=0.0, help='standard deviation of added pixel noise')
+    generate_parser.add_argument('--seed', type=int, default=0, help='seed of the random positions')
+
+    label_parser = subparsers.add_parser('label', help='write a sidecar for a screenshot from the current detector')
+    label_parser.add_argument('screenshot', type=Path, help='PNG screenshot to label')
+    label_parser.add_argument('--left-top', type=int, nargs=2, required=True, help='board corner as x y')
+    label_parser.add_argument('--right-bottom', type=int, nargs=2, required=True, help='board corner as x y')
+
+    score_parser = subparsers.add_parser('score', help='run a detector over a dataset')
+    score_parser.add_argument('directory', type=Path, help='dataset directory')
+    score_parser.add_argument(
+        '--detector', default='board_detector:BoardDetector', help='detector class to score, as module:Class'
+    )
+    score_parser.add_argument('--repeats', type=int, default=5, help='timed runs per sample')
+    score_parser.add_argument('--group-by', default='theme', help='tag to break the scores down by')
+    score_parser.add_argument('--json', type=Path, help='write the scores to this file')
+
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        args.directory.mkdir(parents=True, exist_ok=True)
+        count = 0
+        for sample in generate_samples(args.positions, args.noise, args.seed):
+            write_sample(args.directory, sample)
+            count += 1
+        print(f"{count} samples written to {args.directory}")
+    elif args.command == 'label':
+        label(args.screenshot, tuple(args.left_top), tuple(args.right_bottom))
+    else:
+        scores = score(read_dataset(args.directory), load_detector(args.detector), args.repeats, args.group_by)
+        if not scores['overall']:
+            print(f"No labelled samples in {args.directory}")
+            return
+
+        for value, summary in scores['groups'].items():
+            print(format_summary(value, summary))
+        print(format_summary('all', scores['overall']))
+
+        if args.json is not None:
+            with open(args.json, 'w') as f:
+                json.dump(scores, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
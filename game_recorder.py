@@ -0,0 +1,207 @@
+import argparse
+import logging
+import math
+import queue
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from piskvork_client import OWN, OPPONENT
+
+MAGIC = b'PGGR'
+VERSION = 1
+
+GAME_START = 0
+GAME_END = 3
+
+# One record per move, plus one at the start and the end of every game. Games of several boards interleave in one
+# file, so every record carries its game id. Times are seconds since the epoch, NaN where they do not apply.
+RECORD_DTYPE = np.dtype([
+    ('kind', 'u1'),
+    ('x', 'u1'),
+    ('y', 'u1'),
+    ('retries', 'u1'),
+    ('game', '<u4'),
+    ('detected_time', '<f8'),
+    ('click_time', '<f8'),
+    ('brain_latency', '<f4')
+])
+
+# The writer thread collects records for at most this long before writing them out
+FLUSH_INTERVAL = 1.0
+
+
+class GameRecorder:
+    def __init__(self, logger: logging.Logger, path: Path):
+        self.logger = logger
+        self.path = path
+
+        # Moves are timed with time.monotonic(), the file holds wall clock times
+        self._epoch_offset = time.time() - time.monotonic()
+
+        self._next_game = 0
+        if path.is_file() and path.stat().st_size > 0:
+            records = read_records(path)
+            if len(records):
+                self._next_game = int(records['game'].max()) + 1
+
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+
+    def _wall_time(self, monotonic_time: float) -> float:
+        return monotonic_time + self._epoch_offset if monotonic_time is not None else math.nan
+
+    def start_game(self, is_first_move: bool) -> int:
+        with self._lock:
+            game = self._next_game
+            self._next_game += 1
+
+        self._queue.put((GAME_START, 0, 0, int(is_first_move), game, time.time(), math.nan, math.nan))
+        return game
+
+    def end_game(self, game: int):
+        self._queue.put((GAME_END, 0, 0, 0, game, time.time(), math.nan, math.nan))
+
+    def opponent_move(self, game: int, x: int, y: int, detected_time: float):
+        self._queue.put((OPPONENT, x, y, 0, game, self._wall_time(detected_time), math.nan, math.nan))
+
+    def own_move(self, game: int, x: int, y: int, detected_time: float, brain_latency: float, click_time: float,
+                 retries: int):
+        self._queue.put((
+            OWN, x, y, retries, game, self._wall_time(detected_time), self._wall_time(click_time), brain_latency
+        ))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _write(self):
+        with open(self.path, 'ab') as f:
+            if f.tell() == 0:
+                f.write(MAGIC)
+                f.write(bytes([VERSION]))
+
+            closed = False
+            while not closed:
+                # Block for the first record, then take whatever else arrived in the meantime
+                records = [self._queue.get()]
+                deadline = time.monotonic() + FLUSH_INTERVAL
+                while records[-1] is not None and time.monotonic() < deadline:
+                    try:
+                        records.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                    except queue.Empty:
+                        break
+
+                if records[-1] is None:
+                    records.pop()
+                    closed = True
+
+                if records:
+                    f.write(np.array(records, dtype=RECORD_DTYPE).tobytes())
+                    f.flush()
+
+
+def is_recording(path: Path) -> bool:
+    with open(path, 'rb') as f:
+        return f.read(4) == MAGIC
+
+
+def read_records(path: Path) -> np.ndarray:
+    with open(path, 'rb') as f:
+        if f.read(4) != MAGIC or f.read(1)[0] != VERSION:
+            raise ValueError(f"Not a game recording: {path}")
+
+        data = f.read()
+
+    # A crash can leave half a record at the end
+    return np.frombuffer(data[:len(data) - len(data) % RECORD_DTYPE.itemsize], dtype=RECORD_DTYPE)
+
+
+class RecordedGame:
+    def __init__(self, game: int, is_first_move: bool, start_time: float):
+        self.game = game
+        self.is_first_move = is_first_move
+        self.start_time = start_time
+        self.end_time = math.nan
+
+        # Move records in the order they were played
+        self.moves = []
+
+    def move_coordinates(self) -> list[tuple[int, int]]:
+        return [(int(record['x']), int(record['y'])) for record in self.moves]
+
+
+def read_games(path: Path) -> list[RecordedGame]:
+    games = {}
+
+    for record in read_records(path):
+        game = int(record['game'])
+
+        if record['kind'] == GAME_START:
+            games[game] = RecordedGame(game, bool(record['retries']), float(record['detected_time']))
+        elif game in games:
+            if record['kind'] == GAME_END:
+                games[game].end_time = float(record['detected_time'])
+            else:
+                games[game].moves.append(record)
+
+    return list(games.values())
+
+
+def print_board(moves: list[tuple[int, int]], size: int = 15):
+    # First player is X, the board is printed with x going right and y going down like on screen
+    grid = [['.'] * size for _ in range(size)]
+    for ply, (x, y) in enumerate(moves):
+        grid[y][x] = 'X' if ply % 2 == 0 else 'O'
+
+    for row in grid:
+        print(' '.join(row))
+
+
+def replay(game: RecordedGame, ply: int = None):
+    start = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(game.start_time))
+    print(f"Game {game.game} at {start}, {'first' if game.is_first_move else 'second'} move, {len(game.moves)} moves")
+
+    for record in game.moves[:ply]:
+        offset = record['detected_time'] - game.start_time
+        if record['kind'] == OWN:
+            print(
+                f"  {offset:8.2f}s  own       ({record['x']:2}, {record['y']:2})  "
+                f"brain {record['brain_latency'] * 1000:6.0f} ms  "
+                f"click after {(record['click_time'] - record['detected_time']) * 1000:6.0f} ms  "
+                f"{record['retries']} retries"
+            )
+        else:
+            print(f"  {offset:8.2f}s  opponent  ({record['x']:2}, {record['y']:2})")
+
+    print_board(game.move_coordinates()[:ply])
+
+    own_moves = [record for record in game.moves if record['kind'] == OWN]
+    if own_moves:
+        print(
+            f"  mean brain latency {np.mean([record['brain_latency'] for record in own_moves]) * 1000:.0f} ms, "
+            f"mean detection to click "
+            f"{np.mean([record['click_time'] - record['detected_time'] for record in own_moves]) * 1000:.0f} ms, "
+            f"{sum(int(record['retries']) for record in own_moves)} click retries"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded games.')
+    parser.add_argument('recording', type=Path, help='game recording to read')
+    parser.add_argument('--game', type=int, help='only replay the game with this id')
+    parser.add_argument('--ply', type=int, help='stop every replay after this many moves')
+    args = parser.parse_args()
+
+    for game in read_games(args.recording):
+        if args.game is None or game.game == args.game:
+            replay(game, args.ply)
+            print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+import logging
+import threading
+import time
+from typing import Callable
+
+from board_detector import BLACK, WHITE, BoardState
+from board_sync import BoardSynchronizer
+from game_recorder import GameRecorder
+from move_watcher import MoveWatcher
+from papergames_manager import PapergamesManager
+from piskvork_client import BrainError
+from piskvork_manager import OPPONENT, PiskvorkManager
+from tracing import TRACER
+
+
+class GameSession:
+    def __init__(
+            self,
+            logger: logging.Logger,
+            papergames_manager: PapergamesManager,
+            piskvork_manager: PiskvorkManager,
+            move_watcher: MoveWatcher,
+            turn_wait_time: float,
+            is_first_move: bool,
+            is_running: Callable[[], bool],
+            mouse_lock: threading.Lock = None,
+            board_sync: bool = True,
+            recorder: GameRecorder = None
+    ):
+        self.logger = logger
+        self.papergames_manager = papergames_manager
+        self.piskvork_manager = piskvork_manager
+        self.move_watcher = move_watcher
+        self.turn_wait_time = turn_wait_time
+        self.is_first_move = is_first_move
+        self.is_running = is_running
+
+        # Several boards share one mouse, so their clicks must never interleave
+        self.mouse_lock = mouse_lock if mouse_lock is not None else threading.Lock()
+
+        # Compares every detected board with the brain's position, first player plays black
+        self.board_synchronizer = BoardSynchronizer(logger, BLACK if is_first_move else WHITE) if board_sync else None
+
+        self.recorder = recorder
+        self._game = None
+
+        self.move_list = [(-1, -1)]
+        self.move_latencies = []
+        self.click_conflicts = 0
+
+    def _sleep(self, secs: float) -> bool:
+        if not self.is_running():
+            return False
+
+        for i in range(int(secs * 10)):
+            if not self.is_running():
+                return False
+
+            time.sleep(0.1)
+
+        return True
+
+    def _click(self, x: int, y: int):
+        if not self.mouse_lock.acquire(blocking=False):
+            self.click_conflicts += 1
+            self.mouse_lock.acquire()
+
+        try:
+            with TRACER.span('click'):
+                self.papergames_manager.move(x, y)
+                self.papergames_manager.mouse_to_original_position()
+        finally:
+            self.mouse_lock.release()
+
+    def _verify_click(self, x: int, y: int) -> tuple[bool, int]:
+        # Make sure the clicking was successful, returns whether it was and how many clicks were retried. The stone
+        # usually shows up within a few frames, the full board is only grabbed again when it does not
+        if self.papergames_manager.wait_for_stone(x, y):
+            if self.board_synchronizer is not None:
+                self.board_synchronizer.verify(x, y)
+            return True, 0
+
+        retry_time = 0
+        while True:
+            if not self._sleep(1 + retry_time * 2):
+                return False, retry_time
+
+            last_move = self.papergames_manager.get_last_move()
+            if last_move == (x, y) or last_move not in self.move_list:
+                return True, retry_time
+
+            retry_time += 1
+            if retry_time > 3:
+                self.logger.error("Failed to click. Maybe game is over.")
+                return False, retry_time - 1
+
+            self.logger.warning('Clicking failed, retrying...')
+            self._click(x, y)
+
+    def run(self):
+        if self.recorder is not None:
+            self._game = self.recorder.start_game(self.is_first_move)
+
+        try:
+            self._play()
+        finally:
+            if self.recorder is not None:
+                self.recorder.end_game(self._game)
+
+    def _play(self):
+        time_manager = self.piskvork_manager.time_manager
+
+        if self.is_first_move:
+            start_time = time.monotonic()
+            time_manager.start_turn(self.piskvork_manager.moves, start_time)
+            try:
+                x, y = self.piskvork_manager.begin()
+            except BrainError as e:
+                self.logger.error(f"Piskvork brain failed: {e}")
+                return
+            brain_latency = time.monotonic() - start_time
+
+            self._click(x, y)
+            time_manager.end_turn()
+            if self.recorder is not None:
+                self.recorder.own_move(self._game, x, y, start_time, brain_latency, time.monotonic(), 0)
+            self.logger.info(f"My move: {(x, y)}")
+            self.move_list.append((x, y))
+
+        self.move_watcher.expect_opponent(self.move_list)
+
+        while True:
+            # Block until the watcher reports a new move, waking up regularly to notice a stop request
+            move_event = self.move_watcher.wait_for_move(0.1)
+
+            if not self.is_running():
+                return
+
+            if move_event is None:
+                continue
+
+            last_move = move_event.move
+            self.logger.info(f"Opponent move: {last_move}")
+            self.move_list.append(last_move)
+            TRACER.record('detection_latency', move_event.latency)
+            if self.recorder is not None:
+                self.recorder.opponent_move(self._game, last_move[0], last_move[1], move_event.detected_time)
+
+            # The opponent's move was on screen from the moment it was detected, our clock runs since then
+            time_manager.start_turn(self.piskvork_manager.moves, move_event.detected_time)
+
+            # Get my move from piskvork brain
+            brain_start = time.monotonic()
+            try:
+                x, y = self._get_move(last_move, move_event.board_state)
+            except BrainError as e:
+                self.logger.error(f"Piskvork brain failed: {e}")
+                return
+            brain_latency = time.monotonic() - brain_start
+
+            # Wait for clicking the mouse, moves that needed no search are played at once
+            wait_time = time_manager.wait_time(self.turn_wait_time)
+            if wait_time > 0:
+                with TRACER.span('pad'):
+                    if not self._sleep(wait_time):
+                        return
+
+            self._click(x, y)
+            click_time = time.monotonic()
+            time_manager.end_turn()
+            self.move_latencies.append(click_time - move_event.detected_time)
+            TRACER.record('move', click_time - move_event.detected_time)
+            self.logger.info(f"My move: {(x, y)}")
+            self.move_list.append((x, y))
+
+            with TRACER.span('verify'):
+                clicked, retries = self._verify_click(x, y)
+            if self.recorder is not None:
+                self.recorder.own_move(
+                    self._game, x, y, move_event.detected_time, brain_latency, click_time, retries
+                )
+
+            if not clicked:
+                return
+
+            self.move_watcher.expect_opponent(self.move_list)
+
+    def _get_move(self, last_move: tuple[int, int], board_state: BoardState) -> tuple[int, int]:
+        if self.board_synchronizer is None:
+            return self.piskvork_manager.get_move(last_move[0], last_move[1])
+
+        moves = self.piskvork_manager.moves + [(last_move[0], last_move[1], OPPONENT)]
+        if self.board_synchronizer.in_sync(moves, board_state.grid):
+            return self.piskvork_manager.get_move(last_move[0], last_move[1])
+
+        # A single misread frame must not resync the brain, so the mismatch has to show up on a fresh grab as well
+        confirmed_board_state = self.papergames_manager.get_board_state()
+        if confirmed_board_state is None or not (confirmed_board_state.grid == board_state.grid).all():
+            return self.piskvork_manager.get_move(last_move[0], last_move[1])
+
+        refusal = self.board_synchronizer.refusal(board_state.grid, last_move)
+        if refusal is not None:
+            self.logger.warning(
+                f"Board out of sync ({self.board_synchronizer.describe(moves, board_state.grid)}), not resyncing: "
+                f"{refusal}."
+            )
+            return self.piskvork_manager.get_move(last_move[0], last_move[1])
+
+        self.logger.warning(
+            f"Board out of sync ({self.board_synchronizer.describe(moves, board_state.grid)}), resyncing brain."
+        )
+        x, y = self.piskvork_manager.board(
+            self.board_synchronizer.reconcile(self.piskvork_manager.moves, board_state.grid, last_move)
+        )
+        self.move_list = [(-1, -1)] + [(move_x, move_y) for move_x, move_y, _ in self.piskvork_manager.moves[:-1]]
+
+        return x, y
+
+    def log_stats(self):
+        if self.papergames_manager.relocations:
+            self.logger.info(f"Board located again {self.papergames_manager.relocations} times")
+
+        if self.board_synchronizer is not None and (self.board_synchronizer.resyncs or self.board_synchronizer.refused):
+            self.logger.info(
+                f"Board sync: {self.board_synchronizer.resyncs} resyncs, {self.board_synchronizer.refused} refused"
+            )
+
+        if self.piskvork_manager.move_cache is not None:
+            lookups = self.piskvork_manager.cache_hits + self.piskvork_manager.cache_misses
+            self.logger.info(
+                f"Move cache: {self.piskvork_manager.cache_hits}/{lookups} hits "
+                f"({self.piskvork_manager.cache_hits / lookups * 100 if lookups else 0:.0f}%), "
+                f"{len(self.piskvork_manager.move_cache)} positions"
+            )
+
+        if self.piskvork_manager.opening_book is not None:
+            self.logger.info(f"Opening book: {self.piskvork_manager.book_hits} moves")
+
+        if self.piskvork_manager.ponderer is not None:
+            self.logger.info(
+                f"Ponder: {self.piskvork_manager.ponderer.hits} hits, {self.piskvork_manager.ponderer.misses} misses"
+            )
+
+        parallel = self.piskvork_manager.parallel
+        if parallel is not None:
+            self.logger.info(
+                f"Parallel search: {parallel.searches} searches, {parallel.split_votes} split votes, "
+                f"{parallel.stragglers} late brains"
+            )
+
+        time_manager = self.piskvork_manager.time_manager
+        if time_manager.enabled:
+            self.logger.info(
+                f"Time: {time_manager.searched_moves} searched, {time_manager.instant_moves} instant moves, "
+                f"{time_manager.bank:.1f}s banked" +
+                (f", {time_manager.time_left:.1f}s left on the clock" if time_manager.timeout_match != 0 else '')
+            )
+
+        stats = self.move_watcher.stats()
+        self.logger.info(
+            f"Move watcher: {stats['polls']} polls, "
+            f"mean detection latency {stats['mean_detection_latency'] * 1000:.0f} ms, "
+            f"CPU duty cycle {stats['cpu_duty_cycle'] * 100:.1f}%"
+        )
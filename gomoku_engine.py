@@ -0,0 +1,611 @@
+import asyncio
+import itertools
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from move_cache import ZOBRIST
+from piskvork_client import AsyncPiskvorkClient, BrainError, BrainEvent, CLOSED, ERROR, OWN, OPPONENT, parse_output
+
+# Passed instead of a pbrain path to play with the engine in this module
+BUILTIN_BRAIN = 'builtin'
+
+BOARD_SIZE = 15
+EMPTY = 0
+WALL = 3
+
+# The board is stored with a wall 4 cells wide around it, so scanning 4 cells along a line never leaves the array
+PAD = 4
+WIDTH = BOARD_SIZE + 2 * PAD
+CELLS = WIDTH * WIDTH
+DIRECTIONS = (1, WIDTH, WIDTH + 1, WIDTH - 1)
+OFFSETS = (-4, -3, -2, -1, 1, 2, 3, 4)
+
+# What a stone placed on a cell makes along one line, weakest first
+NONE, BLOCK1, FLEX1, BLOCK2, FLEX2, BLOCK3, FLEX3, BLOCK4, FLEX4, FIVE = range(10)
+PATTERN_SCORES = (0, 1, 3, 6, 20, 25, 80, 90, 300, 1000)
+
+# What a stone placed on a cell threatens over all 4 lines together, weakest first
+THREE_LEVEL, DOUBLE_THREE_LEVEL, FOUR_LEVEL, FOUR_THREE_LEVEL, FLEX4_LEVEL, FIVE_LEVEL = range(1, 7)
+LEVEL_WEIGHT = 10000
+
+# Cell values: the threat level above the summed pattern scores
+THREE_VALUE = THREE_LEVEL * LEVEL_WEIGHT
+FOUR_VALUE = FOUR_LEVEL * LEVEL_WEIGHT
+FOUR_THREE_VALUE = FOUR_THREE_LEVEL * LEVEL_WEIGHT
+FLEX4_VALUE = FLEX4_LEVEL * LEVEL_WEIGHT
+FIVE_VALUE = FIVE_LEVEL * LEVEL_WEIGHT
+
+WIN = 1000000000
+# Scores above this are wins found by the search
+WIN_THRESHOLD = WIN - 1000
+
+EXACT, LOWER, UPPER = range(3)
+
+MAX_DEPTH = 20
+MAX_PLY = 40
+ROOT_WIDTH = 20
+WIDTH_LIMIT = 10
+# Transposition table entries kept before it is cleared
+MAX_TABLE_SIZE = 1000000
+# Nodes searched between two looks at the clock
+CHECK_INTERVAL = 256
+
+# Used when the manager never sends a turn timeout, and the share of the timeout the search may use
+DEFAULT_TURN_TIME = 1.0
+TIME_SAFETY = 0.8
+
+
+def is_five(line: tuple) -> bool:
+    # Five or more in a row through the middle of the line
+    left = right = 4
+    while left > 0 and line[left - 1] == OWN:
+        left -= 1
+    while right < 8 and line[right + 1] == OWN:
+        right += 1
+
+    return right - left >= 4
+
+
+_line_patterns = {}
+
+
+def line_pattern(line: tuple) -> int:
+    # Line of 9 cells with own stone in the middle, EMPTY, OWN or WALL for anything that blocks
+    pattern = _line_patterns.get(line)
+    if pattern is not None:
+        return pattern
+
+    empties = [i for i, cell in enumerate(line) if cell == EMPTY]
+    fills = [line[:i] + (OWN,) + line[i + 1:] for i in empties]
+
+    fours = sum(1 for fill in fills if is_five(fill))
+    if is_five(line):
+        pattern = FIVE
+    elif fours >= 2:
+        pattern = FLEX4
+    elif fours == 1:
+        pattern = BLOCK4
+    else:
+        # One stone more makes the next pattern up, e.g. a three is a line that becomes a four
+        pattern = max((line_pattern(fill) for fill in fills), default=NONE)
+        pattern = pattern - 2 if pattern >= BLOCK2 else NONE
+
+    _line_patterns[line] = pattern
+    return pattern
+
+
+def cell_value(patterns: tuple) -> int:
+    fours = sum(1 for pattern in patterns if pattern == BLOCK4)
+    threes = sum(1 for pattern in patterns if pattern == FLEX3)
+
+    if FIVE in patterns:
+        level = FIVE_LEVEL
+    elif FLEX4 in patterns or fours >= 2:
+        level = FLEX4_LEVEL
+    elif fours and threes:
+        level = FOUR_THREE_LEVEL
+    elif fours:
+        level = FOUR_LEVEL
+    elif threes >= 2:
+        level = DOUBLE_THREE_LEVEL
+    elif threes:
+        level = THREE_LEVEL
+    else:
+        level = 0
+
+    return level * LEVEL_WEIGHT + sum(PATTERN_SCORES[pattern] for pattern in patterns)
+
+
+# Pattern of every line, indexed by the 8 cells around the middle as base 3 digits: 0 empty, 1 own, 2 blocked
+LINE_TABLE = [
+    line_pattern(cells[:4] + (OWN,) + cells[4:])
+    for cells in itertools.product((EMPTY, OWN, WALL), repeat=8)
+]
+# Value of a cell, indexed by its 4 line patterns as base 10 digits
+VALUE_TABLE = [cell_value(patterns) for patterns in itertools.product(range(10), repeat=4)]
+
+# For every cell, the cells whose lines pass through it: (cell, direction, weight of its digit)
+AFFECTED = [[] for _ in range(CELLS)]
+for _cell in range(CELLS):
+    for _direction, _step in enumerate(DIRECTIONS):
+        for _position, _offset in enumerate(OFFSETS):
+            AFFECTED[_cell].append((_cell - _offset * _step, _direction, 3 ** (7 - _position)))
+
+ZOBRIST_KEYS = [[0] * CELLS for _ in range(3)]
+for _player in (OWN, OPPONENT):
+    for _y in range(BOARD_SIZE):
+        for _x in range(BOARD_SIZE):
+            ZOBRIST_KEYS[_player][(_y + PAD) * WIDTH + _x + PAD] = int(ZOBRIST[_player, _y, _x])
+SIDE_KEY = int(ZOBRIST[0, 0, 0])
+
+
+def to_cell(x: int, y: int) -> int:
+    return (y + PAD) * WIDTH + x + PAD
+
+
+def to_move(cell: int) -> tuple[int, int]:
+    y, x = divmod(cell, WIDTH)
+    return x - PAD, y - PAD
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class GomokuEngine:
+    # Freestyle gomoku search: alpha-beta with iterative deepening and a transposition table over a board whose
+    # threats are updated incrementally as stones are placed and removed
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+
+        self.table = {}
+        self.nodes = 0
+        self._deadline = None
+        self._stopped = False
+
+        self.reset()
+
+    def reset(self):
+        self.board = [WALL] * CELLS
+        for y in range(BOARD_SIZE):
+            for x in range(BOARD_SIZE):
+                self.board[to_cell(x, y)] = EMPTY
+
+        self.stones = np.array(self.board, dtype=np.int8)
+        self.near = np.zeros((WIDTH, WIDTH), dtype=np.int16)
+        self.near_flat = self.near.reshape(CELLS)
+
+        # Line digits and patterns per player, cell and direction, at index cell * 4 + direction
+        self.keys = {player: [0] * (CELLS * 4) for player in (OWN, OPPONENT)}
+        self.patterns = {player: [NONE] * (CELLS * 4) for player in (OWN, OPPONENT)}
+        for cell in range(CELLS):
+            if self.board[cell] != WALL:
+                for player in (OWN, OPPONENT):
+                    for direction, step in enumerate(DIRECTIONS):
+                        key = 0
+                        for offset in OFFSETS:
+                            key = key * 3 + (2 if self.board[cell + offset * step] == WALL else 0)
+                        self.keys[player][cell * 4 + direction] = key
+
+        # Value of playing every empty cell, as a list for single reads and an array for the move generator
+        self.values = {player: [0] * CELLS for player in (OWN, OPPONENT)}
+        self.value_arrays = {player: np.zeros(CELLS, dtype=np.int64) for player in (OWN, OPPONENT)}
+        self.totals = {OWN: 0, OPPONENT: 0}
+        for cell in range(CELLS):
+            if self.board[cell] == EMPTY:
+                self._refresh(cell)
+
+        self.hash = 0
+        self.side = OWN
+        self.history = []
+
+    def _set_value(self, player: int, cell: int, value: int):
+        self.totals[player] += value - self.values[player][cell]
+        self.values[player][cell] = value
+        self.value_arrays[player][cell] = value
+
+    def _refresh(self, cell: int):
+        for player in (OWN, OPPONENT):
+            keys, patterns = self.keys[player], self.patterns[player]
+            index = cell * 4
+            for direction in range(4):
+                patterns[index + direction] = LINE_TABLE[keys[index + direction]]
+
+            self._set_value(player, cell, VALUE_TABLE[
+                patterns[index] * 1000 + patterns[index + 1] * 100 + patterns[index + 2] * 10 + patterns[index + 3]
+            ])
+
+    def _update_lines(self, cell: int, player: int, sign: int):
+        # Adds or removes the stone in the line digits of every cell within 4 cells of it, and re-values the empty
+        # ones, which is all that placing or removing a stone changes
+        board = self.board
+        for other in (OWN, OPPONENT):
+            keys, patterns, values = self.keys[other], self.patterns[other], self.values[other]
+            value_array = self.value_arrays[other]
+            digit = sign if other == player else 2 * sign
+            total = self.totals[other]
+
+            for affected, direction, weight in AFFECTED[cell]:
+                if board[affected] == WALL:
+                    continue
+
+                index = affected * 4
+                keys[index + direction] += digit * weight
+                if board[affected] != EMPTY:
+                    continue
+
+                patterns[index + direction] = LINE_TABLE[keys[index + direction]]
+                value = VALUE_TABLE[
+                    patterns[index] * 1000 + patterns[index + 1] * 100 + patterns[index + 2] * 10 + patterns[index + 3]
+                ]
+                total += value - values[affected]
+                values[affected] = value
+                value_array[affected] = value
+
+            self.totals[other] = total
+
+    def play(self, cell: int, player: int = None):
+        player = self.side if player is None else player
+
+        self.board[cell] = player
+        self.stones[cell] = player
+        for other in (OWN, OPPONENT):
+            self._set_value(other, cell, 0)
+
+        y, x = divmod(cell, WIDTH)
+        self.near[y - 2:y + 3, x - 2:x + 3] += 1
+
+        self._update_lines(cell, player, 1)
+
+        self.hash ^= ZOBRIST_KEYS[player][cell]
+        self.history.append((cell, player, self.side))
+        self._set_side(OWN + OPPONENT - player)
+
+    def undo(self):
+        cell, player, side = self.history.pop()
+
+        self._update_lines(cell, player, -1)
+
+        y, x = divmod(cell, WIDTH)
+        self.near[y - 2:y + 3, x - 2:x + 3] -= 1
+
+        self.board[cell] = EMPTY
+        self.stones[cell] = EMPTY
+        self._refresh(cell)
+
+        self.hash ^= ZOBRIST_KEYS[player][cell]
+        self._set_side(side)
+
+    def _set_side(self, side: int):
+        if side != self.side:
+            self.hash ^= SIDE_KEY
+            self.side = side
+
+    def set_position(self, moves: list):
+        self.reset()
+        for x, y, player in moves:
+            self.play(to_cell(x, y), player)
+
+        # The engine always searches for its own stones
+        self._set_side(OWN)
+
+    def generate(self, width: int) -> list:
+        # Candidates are the empty cells near a stone, and threats on the board narrow them down to the moves that
+        # win or defend
+        candidates = np.flatnonzero((self.near_flat > 0) & (self.stones == EMPTY))
+        if len(candidates) == 0:
+            return []
+
+        own = self.value_arrays[self.side][candidates]
+        opponent = self.value_arrays[OWN + OPPONENT - self.side][candidates]
+        own_best, opponent_best = own.max(), opponent.max()
+
+        if own_best >= FIVE_VALUE:
+            return [int(candidates[own.argmax()])]
+        if opponent_best >= FIVE_VALUE:
+            return [int(candidates[opponent.argmax()])]
+        if own_best >= FLEX4_VALUE:
+            return [int(candidates[own.argmax()])]
+
+        if opponent_best >= FLEX4_VALUE:
+            # An open three: block it, or answer with a four
+            keep = (opponent >= FOUR_VALUE) | (own >= FOUR_VALUE)
+        elif opponent_best >= FOUR_THREE_VALUE:
+            keep = (opponent >= THREE_VALUE) | (own >= FOUR_VALUE)
+        else:
+            keep = None
+
+        if keep is not None:
+            candidates, own, opponent = candidates[keep], own[keep], opponent[keep]
+
+        scores = own * 4 + opponent * 3
+        if len(scores) > width:
+            top = np.argpartition(-scores, width)[:width]
+            candidates, scores = candidates[top], scores[top]
+
+        return [int(cell) for cell in candidates[np.argsort(-scores, kind='stable')]]
+
+    def evaluate(self) -> int:
+        side, other = self.side, OWN + OPPONENT - self.side
+        return self.totals[side] * 6 // 5 - self.totals[other]
+
+    def search(self, time_limit: float, max_depth: int = MAX_DEPTH) -> tuple[int, int]:
+        start_time = time.perf_counter()
+        self._deadline = start_time + time_limit
+        self._stopped = False
+        self.nodes = 0
+
+        if not self.history:
+            return BOARD_SIZE // 2, BOARD_SIZE // 2
+
+        if len(self.table) > MAX_TABLE_SIZE:
+            self.table = {}
+
+        moves = self.generate(ROOT_WIDTH)
+        if not moves:
+            raise ValueError('No empty cell left on the board')
+        if len(moves) == 1:
+            return to_move(moves[0])
+
+        best_move, best_score, depth = moves[0], 0, 0
+        for depth in range(1, max_depth + 1):
+            try:
+                score, move = self._root(depth, moves)
+            except SearchTimeout:
+                break
+
+            best_move, best_score = move, score
+            # The best move is searched first in the next iteration
+            moves.remove(move)
+            moves.insert(0, move)
+
+            if abs(score) >= WIN_THRESHOLD:
+                break
+
+        self.logger.debug(
+            f"Engine: {to_move(best_move)} score {best_score} depth {depth} {self.nodes} nodes in "
+            f"{time.perf_counter() - start_time:.2f}s"
+        )
+
+        return to_move(best_move)
+
+    def stop(self):
+        self._stopped = True
+
+    def _root(self, depth: int, moves: list) -> tuple[int, int]:
+        alpha, beta = -WIN, WIN
+        best_move = moves[0]
+
+        for move in moves:
+            self.play(move)
+            try:
+                score = -self._negamax(depth - 1, -beta, -alpha, 1)
+            finally:
+                self.undo()
+
+            if score > alpha:
+                alpha, best_move = score, move
+
+        return alpha, best_move
+
+    def _negamax(self, depth: int, alpha: int, beta: int, ply: int) -> int:
+        self.nodes += 1
+        if self.nodes % CHECK_INTERVAL == 0 and (self._stopped or time.perf_counter() > self._deadline):
+            raise SearchTimeout()
+
+        side, other = self.side, OWN + OPPONENT - self.side
+        own_best = self.value_arrays[side].max()
+        if own_best >= FIVE_VALUE:
+            return WIN - ply
+
+        opponent_fives = int(np.count_nonzero(self.value_arrays[other] >= FIVE_VALUE))
+        if opponent_fives >= 2:
+            return -(WIN - ply - 1)
+        if own_best >= FLEX4_VALUE and opponent_fives == 0:
+            return WIN - ply - 2
+
+        if depth <= 0 or ply >= MAX_PLY:
+            return self.evaluate()
+
+        original_alpha = alpha
+        table_move = None
+        entry = self.table.get(self.hash)
+        if entry is not None:
+            entry_depth, flag, value, table_move = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return value
+                if flag == LOWER and value >= beta:
+                    return value
+                if flag == UPPER and value <= alpha:
+                    return value
+
+        moves = self.generate(WIDTH_LIMIT)
+        if not moves:
+            return 0
+        if table_move in moves:
+            moves.remove(table_move)
+            moves.insert(0, table_move)
+
+        # Forced replies do not use up depth, so threat sequences are read to the end
+        next_depth = depth if len(moves) == 1 else depth - 1
+
+        best_score, best_move = -WIN, moves[0]
+        for move in moves:
+            self.play(move)
+            try:
+                score = -self._negamax(next_depth, -beta, -alpha, ply + 1)
+            finally:
+                self.undo()
+
+            if score > best_score:
+                best_score, best_move = score, move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table[self.hash] = (depth, flag, best_score, best_move)
+
+        return best_score
+
+
+class EngineBrain:
+    # The piskvork protocol in front of the engine, one input line at a time
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+        self.engine = GomokuEngine(logger)
+
+        self.moves = []
+        self.timeout_turn = 0.0
+        self.time_left = None
+        self._board_moves = None
+
+    def stop(self):
+        self.engine.stop()
+
+    def time_limit(self) -> float:
+        time_limit = self.timeout_turn if self.timeout_turn > 0 else DEFAULT_TURN_TIME
+        if self.time_left is not None:
+            time_limit = min(time_limit, self.time_left / 10)
+
+        return max(time_limit * TIME_SAFETY, 0.01)
+
+    def _play(self) -> str:
+        self.engine.set_position(self.moves)
+        x, y = self.engine.search(self.time_limit())
+        self.moves.append((x, y, OWN))
+
+        return f"{x},{y}"
+
+    def handle(self, input_str: str) -> list:
+        input_str = input_str.strip()
+        command, _, arguments = input_str.partition(' ')
+        command = command.upper()
+
+        if self._board_moves is not None:
+            if command == 'DONE':
+                self.moves, self._board_moves = self._board_moves, None
+                return [self._play()]
+
+            x, y, player = (int(value) for value in input_str.split(','))
+            self._board_moves.append((x, y, player))
+            return []
+
+        if command == 'START':
+            if arguments.strip() != str(BOARD_SIZE):
+                return [f"ERROR only {BOARD_SIZE}x{BOARD_SIZE} boards are supported"]
+
+            self.moves = []
+            return ['OK']
+        elif command == 'RESTART':
+            self.moves = []
+            self.engine.table = {}
+            return ['OK']
+        elif command == 'BEGIN':
+            self.moves = []
+            return [self._play()]
+        elif command == 'TURN':
+            x, y = (int(value) for value in arguments.split(','))
+            self.moves.append((x, y, OPPONENT))
+            return [self._play()]
+        elif command == 'BOARD':
+            self._board_moves = []
+            return []
+        elif command == 'INFO':
+            key, _, value = arguments.partition(' ')
+            if key == 'timeout_turn':
+                self.timeout_turn = int(value) / 1000
+            elif key == 'time_left':
+                self.time_left = int(value) / 1000
+            return []
+        elif command == 'ABOUT':
+            return ['name="builtin", version="1.0"']
+        elif command == 'END':
+            return []
+
+        return [f"UNKNOWN {input_str}"]
+
+
+class EngineProcess:
+    # Stands in for the brain process, so code checking on the process works the same
+    def __init__(self):
+        self.returncode = None
+
+
+class EngineClient(AsyncPiskvorkClient):
+    # Speaks to the engine in this process instead of a pipe. Commands run on a worker thread of their own, one at
+    # a time and in order, so the event loop stays free during a search.
+
+    async def start(self, pbrain_path: Path = None, **kwargs):
+        self.brain = EngineBrain(self.logger)
+        self.proc = EngineProcess()
+
+        self._events = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def send(self, *input_strs: str):
+        if self.proc.returncode is not None:
+            raise BrainError(f"Brain exited with code {self.proc.returncode}")
+
+        for input_str in input_strs:
+            self.logger.debug(f"Brain input: {input_str}")
+
+        loop = asyncio.get_running_loop()
+        loop.run_in_executor(self._executor, self._handle, loop, input_strs)
+
+    def _handle(self, loop: asyncio.AbstractEventLoop, input_strs: tuple):
+        for input_str in input_strs:
+            try:
+                output_strs = self.brain.handle(input_str)
+            except Exception as e:
+                output_strs = [f"ERROR {type(e).__name__}: {e}"]
+
+            for output_str in output_strs:
+                self.logger.debug(f"Brain output: {output_str}")
+
+                event = parse_output(output_str)
+                if event.kind == ERROR:
+                    self.logger.error(f"Brain error: {event.text}")
+
+                loop.call_soon_threadsafe(self._events.put_nowait, event)
+
+    async def kill(self):
+        if self.proc is None or self.proc.returncode is not None:
+            return
+
+        # A search in progress gives up at its next look at the clock
+        self.brain.stop()
+        self.proc.returncode = 0
+        self._executor.shutdown(wait=False)
+        await self._events.put(BrainEvent(CLOSED, ''))
+
+
+def main():
+    # The same engine as a standalone pbrain, reading the protocol from stdin
+    logging.basicConfig(level=logging.WARNING)
+    brain = EngineBrain(logging.getLogger())
+
+    for input_str in sys.stdin:
+        for output_str in brain.handle(input_str):
+            sys.stdout.write(output_str + '\r\n')
+            sys.stdout.flush()
+
+        if input_str.strip().upper() == 'END':
+            return
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import argparse
+import json
+import logging
+from pathlib import Path
+
+from multi_board import run_config
+
+
+def board_config(config: dict, is_first_move: bool, trace_path: Path = None) -> dict:
+    # The settings saved by the GUI, as a multi board config with a single board
+    pbrain = dict(config['pbrain'])
+    if pbrain.pop('move_cache', False):
+        pbrain['move_cache_path'] = 'move_cache.bin'
+    if not pbrain.pop('opening_book', False):
+        pbrain.pop('opening_book_path', None)
+
+    return {
+        'pbrain': pbrain,
+        'turn_wait_time': config['turn_wait_time'],
+        'record_path': 'games.bin' if config.get('record', False) else None,
+        'board_sync': config.get('board_sync', True),
+        'trace_path': str(trace_path) if trace_path is not None else None,
+        # A single board cannot be mistaken for another one
+        'relocate': True,
+        'boards': [{
+            'name': 'board',
+            'left_top': config['mouse']['left_top'],
+            'right_bottom': config['mouse']['right_bottom'],
+            'is_first_move': is_first_move
+        }]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play on papergames.io without the GUI, e.g. under Xvfb on Linux.')
+    parser.add_argument('--config', type=Path, default=Path('config.json'), help='settings saved by the GUI')
+    parser.add_argument('--first-move', action='store_true', help='play the first move of every game')
+    parser.add_argument('--trace', type=Path, help='write the latency histograms to this file')
+    parser.add_argument('--debug', action='store_true', help='log at debug level')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.INFO,
+        format='%(asctime)s %(name)s %(levelname)s %(message)s'
+    )
+    logger = logging.getLogger('headless')
+
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+
+    run_config(logger, board_config(config, args.first_move, args.trace))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,7 @@
-import ctypes
 import json
 import logging
 import sys
 import threading
-import time
 from pathlib import Path
 
 import PyQt5
@@ -11,10 +9,20 @@ import pynput
 from PyQt5 import QtCore, QtWidgets, QtGui
 from PyQt5.QtGui import QIntValidator, QDoubleValidator
 from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QLineEdit, QGridLayout, QPushButton, QFileDialog, \
-    QMessageBox, QMainWindow, QRadioButton, QButtonGroup
-
+    QMessageBox, QMainWindow, QRadioButton, QButtonGroup, QCheckBox
+
+from debug_preview import DebugPreview
+from game_session import GameSession
+from game_recorder import GameRecorder
+from move_cache import MoveCache
+from opening_book import OpeningBook
+from move_watcher import MoveWatcher
 from papergames_manager import PapergamesManager
-from piskvork_manager import PiskvorkManager
+from board_locator import BoardLocator
+from brain_pool import BrainPool
+from platform_support import default_capture_backend, scale_factor
+from screen_capture import CaptureBackend, ScreenCapture
+from tracing import TRACER, TraceReporter
 
 
 class QTextEditLogger(logging.Handler, QtCore.QObject):
@@ -42,11 +50,35 @@ class DebugWindow(QWidget):
 
         self.label = QLabel()
 
+        # Live latency histograms of every stage of a move
+        self.trace_label = QLabel()
+        self.trace_label.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+
         layout = QGridLayout()
         layout.addWidget(self.label, 0, 0)
+        layout.addWidget(self.trace_label, 1, 0)
         self.setLayout(layout)
 
+        self.preview = DebugPreview(self.label)
+
+        self.trace_timer = QtCore.QTimer(self)
+        self.trace_timer.setInterval(1000)
+        # noinspection PyUnresolvedReferences
+        self.trace_timer.timeout.connect(lambda: self.trace_label.setText(TRACER.format_summary()))
+
         self.setWindowFlag(QtCore.Qt.WindowStaysOnTopHint)
+        self.showEvent = self.show_event
+        self.hideEvent = self.hide_event
+
+    def show_event(self, event):
+        self.preview.enabled = True
+        self.trace_timer.start()
+        event.accept()
+
+    def hide_event(self, event):
+        self.preview.enabled = False
+        self.trace_timer.stop()
+        event.accept()
 
 
 class MainWindow(QMainWindow):
@@ -54,9 +86,12 @@ class MainWindow(QMainWindow):
         super().__init__()
 
         self.config = dict()
-        self.scale_factor = ctypes.windll.shcore.GetScaleFactorForDevice(0) / 100.0
+        self.scale_factor = scale_factor()
         self.screen = QApplication.primaryScreen()
         self.chess_thread_running = False
+        self.brain_pool = None
+        self.move_cache = None
+        self.opening_book = None
 
         self.debug_window = DebugWindow()
 
@@ -72,6 +107,10 @@ class MainWindow(QMainWindow):
         self.pbrain_path_edit = QLineEdit(self)
         self.pbrain_path_edit.setText('pbrain.exe')
 
+        # More pbrains searching every move next to the main one, separated by ';'
+        self.parallel_paths_edit = QLineEdit(self)
+        self.parallel_paths_edit.setText('')
+
         self.pbrain_path_select_button = QPushButton('Select', self)
         # noinspection PyUnresolvedReferences
         self.pbrain_path_select_button.clicked.connect(self.select_pbrain_path)
@@ -96,10 +135,38 @@ class MainWindow(QMainWindow):
         # noinspection PyUnresolvedReferences
         self.set_mouse_button.clicked.connect(self.set_mouse)
 
+        self.locate_board_button = QPushButton('Locate Board', self)
+        # noinspection PyUnresolvedReferences
+        self.locate_board_button.clicked.connect(self.locate_board)
+
         self.timeout_turn_edit = QLineEdit(self)
         self.timeout_turn_edit.setText('4.000')
         self.timeout_turn_edit.setValidator(QDoubleValidator(0.0, 40.0, 3))
 
+        # Whole game clock, 0 when the site only limits single turns
+        self.timeout_match_edit = QLineEdit(self)
+        self.timeout_match_edit.setText('0.000')
+        self.timeout_match_edit.setValidator(QDoubleValidator(0.0, 3600.0, 3))
+
+        self.record_check_box = QCheckBox('Record Games', self)
+        self.record_check_box.setChecked(False)
+
+        # Sends the brain the board as detected when it differs from the brain's position
+        self.board_sync_check_box = QCheckBox('Board Sync', self)
+        self.board_sync_check_box.setChecked(True)
+
+        self.ponder_check_box = QCheckBox('Ponder', self)
+        self.ponder_check_box.setChecked(False)
+
+        self.move_cache_check_box = QCheckBox('Move Cache', self)
+        self.move_cache_check_box.setChecked(False)
+
+        self.opening_book_path_edit = QLineEdit(self)
+        self.opening_book_path_edit.setText('opening_book.bin')
+
+        self.opening_book_check_box = QCheckBox('Use', self)
+        self.opening_book_check_box.setChecked(False)
+
         self.turn_wait_time_edit = QLineEdit(self)
         self.turn_wait_time_edit.setText('4.000')
         self.turn_wait_time_edit.setValidator(QDoubleValidator(0.0, 40.0, 1))
@@ -146,34 +213,49 @@ class MainWindow(QMainWindow):
         self.grid.addWidget(self.pbrain_path_edit, 2, 1)
         self.grid.addWidget(self.pbrain_path_select_button, 2, 2)
 
-        self.grid.addWidget(QLabel('Left Top', self), 3, 0)
-        self.grid.addWidget(self.left_top_corner_mouse_x_edit, 3, 1)
-        self.grid.addWidget(self.left_top_corner_mouse_y_edit, 3, 2)
+        self.grid.addWidget(QLabel('Parallel', self), 3, 0)
+        self.grid.addWidget(self.parallel_paths_edit, 3, 1, 1, 2)
+
+        self.grid.addWidget(QLabel('Left Top', self), 4, 0)
+        self.grid.addWidget(self.left_top_corner_mouse_x_edit, 4, 1)
+        self.grid.addWidget(self.left_top_corner_mouse_y_edit, 4, 2)
+
+        self.grid.addWidget(QLabel('Right Bottom', self), 5, 0)
+        self.grid.addWidget(self.right_bottom_corner_mouse_x_edit, 5, 1)
+        self.grid.addWidget(self.right_bottom_corner_mouse_y_edit, 5, 2)
 
-        self.grid.addWidget(QLabel('Right Bottom', self), 4, 0)
-        self.grid.addWidget(self.right_bottom_corner_mouse_x_edit, 4, 1)
-        self.grid.addWidget(self.right_bottom_corner_mouse_y_edit, 4, 2)
+        self.grid.addWidget(self.set_mouse_button, 6, 0, 1, 2)
+        self.grid.addWidget(self.locate_board_button, 6, 2)
 
-        self.grid.addWidget(self.set_mouse_button, 5, 0, 1, 3)
+        self.grid.addWidget(QLabel('Turn Timeout', self), 7, 0)
+        self.grid.addWidget(self.timeout_turn_edit, 7, 1)
+        self.grid.addWidget(self.ponder_check_box, 7, 2)
 
-        self.grid.addWidget(QLabel('Turn Timeout', self), 6, 0)
-        self.grid.addWidget(self.timeout_turn_edit, 6, 1)
+        self.grid.addWidget(QLabel('Match Time', self), 8, 0)
+        self.grid.addWidget(self.timeout_match_edit, 8, 1)
+        self.grid.addWidget(self.record_check_box, 8, 2)
 
-        self.grid.addWidget(QLabel('Turn Wait Time', self), 7, 0)
-        self.grid.addWidget(self.turn_wait_time_edit, 7, 1)
+        self.grid.addWidget(QLabel('Turn Wait Time', self), 9, 0)
+        self.grid.addWidget(self.turn_wait_time_edit, 9, 1)
+        self.grid.addWidget(self.move_cache_check_box, 9, 2)
 
-        self.grid.addWidget(QLabel('Is First Move', self), 8, 0)
-        self.grid.addWidget(self.is_first_move_radia_button, 8, 1)
-        self.grid.addWidget(self.not_first_move_radia_button, 8, 2)
+        self.grid.addWidget(QLabel('Opening Book', self), 10, 0)
+        self.grid.addWidget(self.opening_book_path_edit, 10, 1)
+        self.grid.addWidget(self.opening_book_check_box, 10, 2)
 
-        self.grid.addWidget(self.start_or_stop_button, 9, 0, 1, 3)
+        self.grid.addWidget(QLabel('Is First Move', self), 11, 0)
+        self.grid.addWidget(self.is_first_move_radia_button, 11, 1)
+        self.grid.addWidget(self.not_first_move_radia_button, 11, 2)
 
-        self.grid.addWidget(QLabel('Log', self), 10, 0, 1, 3)
-        self.grid.addWidget(self.text_logger.widget, 11, 0, 3, 3)
+        self.grid.addWidget(self.start_or_stop_button, 12, 0, 1, 3)
 
-        self.grid.addWidget(self.debug_window_button, 14, 0)
+        self.grid.addWidget(QLabel('Log', self), 13, 0, 1, 3)
+        self.grid.addWidget(self.text_logger.widget, 14, 0, 3, 3)
 
-        self.grid.addWidget(self.about_button, 14, 2)
+        self.grid.addWidget(self.debug_window_button, 17, 0)
+        self.grid.addWidget(self.board_sync_check_box, 17, 1)
+
+        self.grid.addWidget(self.about_button, 17, 2)
 
         self.widget = QWidget()
         self.widget.setLayout(self.grid)
@@ -204,6 +286,9 @@ class MainWindow(QMainWindow):
 
         self.debug_window.close()
 
+        if self.brain_pool is not None:
+            self.brain_pool.close()
+
         event.accept()
 
     def load_config(self):
@@ -212,18 +297,32 @@ class MainWindow(QMainWindow):
                 self.config = json.load(f)
 
                 self.pbrain_path_edit.setText(self.config['pbrain']['path'])
+                self.parallel_paths_edit.setText(';'.join(self.config['pbrain'].get('parallel_paths', [])))
                 self.timeout_turn_edit.setText(str(self.config['pbrain']['timeout_turn']))
+                self.timeout_match_edit.setText(str(self.config['pbrain'].get('timeout_match', 0.0)))
+                self.ponder_check_box.setChecked(self.config['pbrain'].get('ponder', False))
+                self.move_cache_check_box.setChecked(self.config['pbrain'].get('move_cache', False))
+                self.opening_book_path_edit.setText(self.config['pbrain'].get('opening_book_path', 'opening_book.bin'))
+                self.opening_book_check_box.setChecked(self.config['pbrain'].get('opening_book', False))
                 self.left_top_corner_mouse_x_edit.setText(str(self.config['mouse']['left_top']['x']))
                 self.left_top_corner_mouse_y_edit.setText(str(self.config['mouse']['left_top']['y']))
                 self.right_bottom_corner_mouse_x_edit.setText(str(self.config['mouse']['right_bottom']['x']))
                 self.right_bottom_corner_mouse_y_edit.setText(str(self.config['mouse']['right_bottom']['y']))
                 self.turn_wait_time_edit.setText(str(self.config['turn_wait_time']))
+                self.record_check_box.setChecked(self.config.get('record', False))
+                self.board_sync_check_box.setChecked(self.config.get('board_sync', True))
 
     def save_config(self):
         self.config = {
             'pbrain': {
                 'path': self.pbrain_path_edit.text(),
-                'timeout_turn': float(self.timeout_turn_edit.text())
+                'parallel_paths': self.parallel_paths(),
+                'timeout_turn': float(self.timeout_turn_edit.text()),
+                'timeout_match': float(self.timeout_match_edit.text()),
+                'ponder': self.ponder_check_box.isChecked(),
+                'move_cache': self.move_cache_check_box.isChecked(),
+                'opening_book_path': self.opening_book_path_edit.text(),
+                'opening_book': self.opening_book_check_box.isChecked()
             },
             'mouse': {
                 'left_top': {
@@ -235,18 +334,57 @@ class MainWindow(QMainWindow):
                     'y': int(self.right_bottom_corner_mouse_y_edit.text())
                 }
             },
-            'turn_wait_time': float(self.turn_wait_time_edit.text())
+            'turn_wait_time': float(self.turn_wait_time_edit.text()),
+            'record': self.record_check_box.isChecked(),
+            'board_sync': self.board_sync_check_box.isChecked()
         }
 
         with open('config.json', 'w') as f:
             json.dump(self.config, f, indent=4)
 
+    def parallel_paths(self) -> list:
+        return [path.strip() for path in self.parallel_paths_edit.text().split(';') if path.strip()]
+
     def select_pbrain_path(self):
         pbrain_path_str = QFileDialog.getOpenFileName(self, 'Select pbrain', str(Path.cwd()), 'pbrain (*.exe)')[0]
 
         if pbrain_path_str:
             self.pbrain_path_edit.setText(pbrain_path_str)
 
+    def physical_screen_size(self, capture_backend: CaptureBackend) -> tuple[int, int]:
+        # Qt scales its sizes for high DPI, screen grabs and mouse positions are in physical pixels
+        screen_size = capture_backend.screen_size()
+        if screen_size is not None:
+            return screen_size
+
+        return (
+            round(self.screen.size().width() * self.scale_factor),
+            round(self.screen.size().height() * self.scale_factor)
+        )
+
+    def locate_board(self):
+        capture_backend = default_capture_backend()
+        screen_size = self.physical_screen_size(capture_backend)
+        logger = logging.getLogger()
+
+        try:
+            gray = ScreenCapture(capture_backend, (0, 0, *screen_size)).tick()
+        except ValueError as e:
+            QMessageBox.warning(self, 'Locate Board', f"Fail to grab the screen: {e}", QMessageBox.Ok)
+            return
+
+        location = BoardLocator(logger).locate(gray)
+        if location is None:
+            QMessageBox.warning(
+                self, 'Locate Board', 'No board found, make sure it is fully visible!', QMessageBox.Ok
+            )
+            return
+
+        self.left_top_corner_mouse_x_edit.setText(str(location.left_top[0]))
+        self.left_top_corner_mouse_y_edit.setText(str(location.left_top[1]))
+        self.right_bottom_corner_mouse_x_edit.setText(str(location.right_bottom[0]))
+        self.right_bottom_corner_mouse_y_edit.setText(str(location.right_bottom[1]))
+
     def set_mouse(self):
         reply = QMessageBox.question(
             self,
@@ -297,21 +435,7 @@ class MainWindow(QMainWindow):
                 threading.Thread(target=self._start).start()
                 self.start_or_stop_button.setText('Stop')
 
-    def _sleep_and_is_running(self, secs):
-        if not self.chess_thread_running:
-            return False
-
-        for i in range(int(secs * 10)):
-            if not self.chess_thread_running:
-                return False
-
-            time.sleep(0.1)
-
-        return True
-
     def _start(self):
-        is_end = False
-
         logger = logging.getLogger()
 
         logger.addHandler(self.text_logger)
@@ -323,88 +447,101 @@ class MainWindow(QMainWindow):
 
         self.text_logger.widget.clear()
 
-        piskvork_manager = PiskvorkManager(
-            logger,
-            Path(self.pbrain_path_edit.text()),
-            float(self.timeout_turn_edit.text()),
-        )
+        pbrain_path = Path(self.pbrain_path_edit.text())
+        timeout_turn = float(self.timeout_turn_edit.text())
+        timeout_match = float(self.timeout_match_edit.text())
+        ponder = self.ponder_check_box.isChecked()
+        parallel_paths = [Path(path) for path in self.parallel_paths()]
+
+        if self.move_cache_check_box.isChecked() and self.move_cache is None:
+            self.move_cache = MoveCache(logger, Path('move_cache.bin'))
+        move_cache = self.move_cache if self.move_cache_check_box.isChecked() else None
+
+        opening_book_path = Path(self.opening_book_path_edit.text())
+        if self.opening_book is not None and (
+                not self.opening_book_check_box.isChecked() or self.opening_book.path != opening_book_path
+        ):
+            self.opening_book.close()
+            self.opening_book = None
+
+        if self.opening_book_check_box.isChecked() and self.opening_book is None:
+            try:
+                self.opening_book = OpeningBook(logger, opening_book_path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Opening book not loaded: {e}")
+        opening_book = self.opening_book
+
+        # Brains stay warm between games, unless their settings changed
+        if self.brain_pool is not None and (
+                self.brain_pool.pbrain_path != pbrain_path or
+                self.brain_pool.timeout_turn != timeout_turn or
+                self.brain_pool.timeout_match != timeout_match or
+                self.brain_pool.ponder != ponder or
+                self.brain_pool.move_cache is not move_cache or
+                self.brain_pool.opening_book is not opening_book or
+                self.brain_pool.parallel_paths != parallel_paths
+        ):
+            self.brain_pool.close()
+            self.brain_pool = None
+
+        if self.brain_pool is None:
+            self.brain_pool = BrainPool(
+                logger, pbrain_path, timeout_turn, ponder=ponder, move_cache=move_cache, opening_book=opening_book,
+                timeout_match=timeout_match, parallel_paths=parallel_paths
+            )
+
+        piskvork_manager = self.brain_pool.acquire()
 
-        if piskvork_manager.proc is None:
+        if piskvork_manager is None:
             self.chess_thread_running = False
             self.start_or_stop_button.setText('Start')
             return
 
+        capture_backend = default_capture_backend()
         papergames_manager = PapergamesManager(
             logger,
             (int(self.left_top_corner_mouse_x_edit.text()), int(self.left_top_corner_mouse_y_edit.text())),
             (int(self.right_bottom_corner_mouse_x_edit.text()), int(self.right_bottom_corner_mouse_y_edit.text())),
+            capture_backend=capture_backend,
+            debug_preview=self.debug_window.preview,
+            locator=BoardLocator(logger),
+            screen_size=self.physical_screen_size(capture_backend)
         )
 
-        move_list = [(-1, -1)]
-
-        if self.is_first_move_radia_button.isChecked():
-            x, y = piskvork_manager.begin()
-
-            papergames_manager.move(x, y)
-            logger.info(f"My move: {(x, y)}")
-            move_list.append((x, y))
-            papergames_manager.mouse_to_original_position()
-
-        while not is_end:
-            while True:
-                if not self._sleep_and_is_running(0):
-                    is_end = True
-                    break
-
-                last_move = papergames_manager.get_last_move(self.debug_window.label)
+        move_watcher = MoveWatcher(logger, papergames_manager)
+        move_watcher.start()
 
-                if last_move not in move_list:
-                    logger.info(f"Opponent move: {last_move}")
-                    move_list.append(last_move)
+        recorder = GameRecorder(logger, Path('games.bin')) if self.record_check_box.isChecked() else None
 
-                    start_time = time.time()
+        trace_reporter = TraceReporter(logger, path=Path('trace.json'))
+        trace_reporter.start()
 
-                    # Get my move from piskvork brain
-                    x, y = piskvork_manager.get_move(last_move[0], last_move[1])
-
-                    # Wait for clicking the mouse
-                    if time.time() - start_time < float(self.turn_wait_time_edit.text()):
-                        if not self._sleep_and_is_running(
-                                float(self.turn_wait_time_edit.text()) - (time.time() - start_time)
-                        ):
-                            is_end = True
-                            break
-
-                    papergames_manager.move(x, y)
-                    logger.info(f"My move: {(x, y)}")
-                    move_list.append((x, y))
-                    papergames_manager.mouse_to_original_position()
-
-                    # Make sure the clicking was successful
-                    retry_time = 0
-                    while True:
-                        if not self._sleep_and_is_running(1 + retry_time * 2):
-                            is_end = True
-                            break
+        game_session = GameSession(
+            logger,
+            papergames_manager,
+            piskvork_manager,
+            move_watcher,
+            float(self.turn_wait_time_edit.text()),
+            self.is_first_move_radia_button.isChecked(),
+            lambda: self.chess_thread_running,
+            board_sync=self.board_sync_check_box.isChecked(),
+            recorder=recorder
+        )
+        game_session.run()
+        self.chess_thread_running = False
 
-                        last_move = papergames_manager.get_last_move(self.debug_window.label)
-                        if last_move == (x, y) or last_move not in move_list:
-                            break
+        move_watcher.stop()
+        game_session.log_stats()
 
-                        retry_time += 1
-                        if retry_time > 3:
-                            logger.error("Failed to click. Maybe game is over.")
-                            self.chess_thread_running = False
-                            is_end = True
-                            break
+        if recorder is not None:
+            recorder.close()
 
-                        logger.warning('Clicking failed, retrying...')
-                        papergames_manager.move(x, y)
-                        papergames_manager.mouse_to_original_position()
+        trace_reporter.stop()
 
-                    break
+        if move_cache is not None:
+            move_cache.save()
 
-        piskvork_manager.kill()
+        self.brain_pool.release(piskvork_manager)
         self.start_or_stop_button.setText('Start')
         logger.info('Stop!')
 
@@ -0,0 +1,131 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+BOARD_SIZE = 15
+
+MAGIC = b'PGMC'
+VERSION = 1
+RECORD_DTYPE = np.dtype([('hash', '<u8'), ('x', 'u1'), ('y', 'u1'), ('search_time', '<f4')])
+
+_N = BOARD_SIZE - 1
+
+# The 8 symmetries of the board, and for each of them the one that undoes it
+SYMMETRIES = (
+    lambda x, y: (x, y),
+    lambda x, y: (_N - x, y),
+    lambda x, y: (x, _N - y),
+    lambda x, y: (_N - x, _N - y),
+    lambda x, y: (y, x),
+    lambda x, y: (_N - y, x),
+    lambda x, y: (y, _N - x),
+    lambda x, y: (_N - y, _N - x),
+)
+INVERSE_SYMMETRIES = (0, 1, 2, 3, 4, 6, 5, 7)
+
+# Fixed seed, so hashes stay valid across runs and cache files
+ZOBRIST = np.random.default_rng(20230601).integers(
+    0, np.iinfo(np.uint64).max, size=(3, BOARD_SIZE, BOARD_SIZE), dtype=np.uint64, endpoint=True
+)
+
+
+def canonical_hash(moves: list) -> tuple[int, int]:
+    # Hash of the position under all 8 symmetries at once, returns the smallest one and the symmetry giving it
+    if not moves:
+        return 0, 0
+
+    xs = np.array([x for x, _, _ in moves])
+    ys = np.array([y for _, y, _ in moves])
+    players = np.array([player for _, _, player in moves])
+
+    hashes = np.array([
+        np.bitwise_xor.reduce(ZOBRIST[(players, *symmetry(xs, ys))]) for symmetry in SYMMETRIES
+    ], dtype=np.uint64)
+
+    symmetry = int(np.argmin(hashes))
+    return int(hashes[symmetry]), symmetry
+
+
+class MoveCache:
+    def __init__(self, logger: logging.Logger, path: Path = None, max_entries: int = 100000):
+        self.logger = logger
+        self.path = path
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if path is not None and path.is_file():
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, moves: list, min_search_time: float = 0.0) -> Optional[tuple[int, int]]:
+        # Moves searched for much less time than the caller would spend are searched again
+        position_hash, symmetry = canonical_hash(moves)
+
+        with self._lock:
+            entry = self._entries.get(position_hash)
+            if entry is None or entry[2] < min_search_time:
+                return None
+
+            self._entries.move_to_end(position_hash)
+
+        x, y, _ = entry
+        return SYMMETRIES[INVERSE_SYMMETRIES[symmetry]](x, y)
+
+    def put(self, moves: list, move: tuple[int, int], search_time: float):
+        position_hash, symmetry = canonical_hash(moves)
+        x, y = SYMMETRIES[symmetry](*move)
+
+        with self._lock:
+            # A shorter search never replaces a longer one
+            entry = self._entries.get(position_hash)
+            if entry is None or entry[2] <= search_time:
+                self._entries[position_hash] = (x, y, search_time)
+            self._entries.move_to_end(position_hash)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def load(self):
+        with open(self.path, 'rb') as f:
+            if f.read(4) != MAGIC or f.read(1)[0] != VERSION:
+                self.logger.warning(f"Ignoring move cache in unknown format: {self.path}")
+                return
+
+            records = np.fromfile(f, dtype=RECORD_DTYPE)
+
+        # Records are stored from least to most recently used
+        with self._lock:
+            self._entries = OrderedDict(
+                (int(record['hash']), (int(record['x']), int(record['y']), float(record['search_time'])))
+                for record in records[-self.max_entries:]
+            )
+
+        self.logger.info(f"Loaded {len(self._entries)} cached moves from {self.path}")
+
+    def save(self):
+        if self.path is None:
+            return
+
+        with self._lock:
+            records = np.array(
+                [(position_hash, x, y, search_time) for position_hash, (x, y, search_time) in self._entries.items()],
+                dtype=RECORD_DTYPE
+            )
+
+        # Written next to the old file and swapped in, so a crash never leaves half a cache behind
+        temporary_path = self.path.with_suffix(self.path.suffix + '.tmp')
+        with open(temporary_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(bytes([VERSION]))
+            records.tofile(f)
+
+        os.replace(temporary_path, self.path)
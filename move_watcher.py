@@ -0,0 +1,127 @@
+import logging
+import queue
+import threading
+import time
+from typing import Optional
+
+from board_detector import BoardState
+from papergames_manager import PapergamesManager
+
+
+class MoveEvent:
+    def __init__(self, move: tuple[int, int], board_state: BoardState, detected_time: float, latency: float):
+        self.move = move
+        self.board_state = board_state
+        self.detected_time = detected_time
+        self.latency = latency
+
+
+class MoveWatcher:
+    def __init__(
+            self,
+            logger: logging.Logger,
+            papergames_manager: PapergamesManager,
+            min_interval: float = 0.05,
+            max_interval: float = 0.5,
+            backoff: float = 1.25
+    ):
+        self.logger = logger
+        self.papergames_manager = papergames_manager
+
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+
+        self.events = queue.Queue()
+
+        self._known_moves = set()
+        self._interval = min_interval
+        self._watching = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+        self._polls = 0
+        self._detections = 0
+        self._latency_sum = 0.0
+        self._start_time = 0.0
+        self._cpu_time = 0.0
+
+    def start(self, threaded: bool = True):
+        # Without its own thread, the watcher is fed through check by a poller shared between boards
+        self._start_time = time.monotonic()
+        if threaded:
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._watching.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def expect_opponent(self, known_moves: list):
+        # Called right after our move: the reply is most likely soon, so poll fast and back off from there
+        self._known_moves = set(known_moves)
+        self._interval = self.min_interval
+        self._watching.set()
+
+    def wait_for_move(self, timeout: float) -> Optional[MoveEvent]:
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self._start_time
+
+        return {
+            'polls': self._polls,
+            'detections': self._detections,
+            'mean_detection_latency': self._latency_sum / self._detections if self._detections else 0.0,
+            'cpu_duty_cycle': self._cpu_time / elapsed if elapsed > 0 else 0.0
+        }
+
+    def is_watching(self) -> bool:
+        # stop() sets _watching as well, to wake the thread up
+        return self._watching.is_set() and not self._stopped.is_set()
+
+    @property
+    def interval(self) -> float:
+        return self._interval
+
+    def check(self, board_state: Optional[BoardState], poll_start: float, poll_end: float) -> bool:
+        # Called with every freshly detected board, by the watcher thread or by a poller shared between boards
+        self._polls += 1
+
+        if board_state is not None:
+            move = board_state.last_move
+            if move != (-1, -1) and move not in self._known_moves:
+                # The move appeared somewhere in the last interval, so on average half of it is lost
+                latency = self._interval / 2 + (poll_end - poll_start)
+                self._detections += 1
+                self._latency_sum += latency
+
+                # Nothing can change until we answer, so stop polling until expect_opponent is called again
+                self._watching.clear()
+                self.events.put(MoveEvent(move, board_state, poll_end, latency))
+                return True
+
+        self._interval = min(self._interval * self.backoff, self.max_interval)
+        return False
+
+    def _run(self):
+        cpu_start = time.thread_time()
+
+        while not self._stopped.is_set():
+            self._watching.wait()
+            if self._stopped.is_set():
+                break
+
+            poll_start = time.monotonic()
+            board_state = self.papergames_manager.get_board_state()
+            poll_end = time.monotonic()
+
+            self._cpu_time = time.thread_time() - cpu_start
+
+            interval = self._interval
+            if not self.check(board_state, poll_start, poll_end):
+                self._stopped.wait(interval)
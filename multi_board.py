@@ -0,0 +1,350 @@
+import argparse
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from board_detector import EMPTY
+from board_locator import BoardLocator
+from brain_pool import BrainPool
+from game_recorder import GameRecorder
+from game_session import GameSession
+from move_cache import MoveCache
+from move_watcher import MoveWatcher
+from opening_book import OpeningBook
+from papergames_manager import PapergamesManager
+from platform_support import default_capture_backend
+from screen_capture import CaptureBackend, ScreenCapture
+from tracing import TraceReporter
+
+
+class Board:
+    def __init__(self, name: str, left_top_corner_mouse: tuple, right_bottom_corner_mouse: tuple, is_first_move: bool):
+        self.name = name
+        self.left_top_corner_mouse = left_top_corner_mouse
+        self.right_bottom_corner_mouse = right_bottom_corner_mouse
+        self.is_first_move = is_first_move
+
+        self.papergames_manager = None
+        self.move_watcher = None
+        self.thread = None
+
+        self.games = 0
+        self.move_latencies = []
+        self.click_conflicts = 0
+
+
+class MultiBoardScheduler:
+    def __init__(
+            self,
+            logger: logging.Logger,
+            brain_pool: BrainPool,
+            turn_wait_time: float,
+            min_interval: float = 0.05,
+            max_interval: float = 0.5,
+            capture_backend: CaptureBackend = None,
+            recorder: GameRecorder = None,
+            relocate: bool = False,
+            screen_size: tuple[int, int] = None,
+            board_sync: bool = True
+    ):
+        self.logger = logger
+        self.brain_pool = brain_pool
+        self.turn_wait_time = turn_wait_time
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.capture_backend = capture_backend if capture_backend is not None else default_capture_backend()
+        self.recorder = recorder
+        # Boards next to each other can be mistaken for one another, so finding moved boards is opt-in
+        self.relocate = relocate
+        # Searches for a moved board stay inside the screen
+        self.screen_size = screen_size if screen_size is not None else self.capture_backend.screen_size()
+        self.board_sync = board_sync
+
+        self.boards = []
+        self.running = False
+
+        # The mouse is shared by every board, so only one of them may click at a time
+        self.mouse_lock = threading.Lock()
+
+        self._start_time = 0.0
+        self._polls = 0
+        self._cpu_time = 0.0
+
+    def add_board(self, name: str, left_top_corner_mouse: tuple, right_bottom_corner_mouse: tuple,
+                  is_first_move: bool):
+        self.boards.append(Board(name, left_top_corner_mouse, right_bottom_corner_mouse, is_first_move))
+
+    def run(self):
+        self.running = True
+        self._start_time = time.monotonic()
+
+        for board in self.boards:
+            board.papergames_manager = PapergamesManager(
+                self.logger.getChild(board.name),
+                board.left_top_corner_mouse,
+                board.right_bottom_corner_mouse,
+                capture_backend=self.capture_backend,
+                locator=BoardLocator(self.logger.getChild(board.name)) if self.relocate else None,
+                screen_size=self.screen_size
+            )
+            board.thread = threading.Thread(target=self._play, args=(board,), daemon=True)
+
+        poll_thread = threading.Thread(target=self._poll, daemon=True)
+        poll_thread.start()
+
+        for board in self.boards:
+            board.thread.start()
+
+        try:
+            for board in self.boards:
+                board.thread.join()
+        finally:
+            self.running = False
+
+            for board in self.boards:
+                board.thread.join()
+            poll_thread.join()
+
+        self.log_metrics()
+
+    def stop(self):
+        self.running = False
+
+    def _play(self, board: Board):
+        logger = self.logger.getChild(board.name)
+
+        while self.running:
+            piskvork_manager = self.brain_pool.acquire()
+            if piskvork_manager is None:
+                return
+
+            board.papergames_manager.reset_detector()
+            board.move_watcher = MoveWatcher(
+                logger, board.papergames_manager, min_interval=self.min_interval, max_interval=self.max_interval
+            )
+            board.move_watcher.start(threaded=False)
+
+            game_session = GameSession(
+                logger,
+                board.papergames_manager,
+                piskvork_manager,
+                board.move_watcher,
+                self.turn_wait_time,
+                board.is_first_move,
+                lambda: self.running,
+                mouse_lock=self.mouse_lock,
+                board_sync=self.board_sync,
+                recorder=self.recorder
+            )
+            game_session.run()
+
+            board.move_watcher.stop()
+            # The poller leaves the board alone until the next game has started
+            board.move_watcher = None
+            game_session.log_stats()
+            self.brain_pool.release(piskvork_manager)
+
+            board.move_latencies += game_session.move_latencies
+            board.click_conflicts += game_session.click_conflicts
+
+            if not self.running:
+                return
+
+            board.games += 1
+            logger.info(f"Game {board.games} over, waiting for a new game.")
+            self._wait_for_new_game(board)
+
+    def _wait_for_new_game(self, board: Board):
+        while self.running:
+            board_state = board.papergames_manager.get_board_state()
+            if board_state is not None and (board_state.grid == EMPTY).all():
+                return
+
+            time.sleep(self.max_interval)
+
+    def _poll(self):
+        cpu_start = time.thread_time()
+
+        screen_capture = None
+
+        while self.running:
+            # One capture covering every board, each board then reads its own view of it. A board that was found
+            # somewhere else may need a bigger one.
+            bbox = (
+                min(board.papergames_manager.bbox[0] for board in self.boards),
+                min(board.papergames_manager.bbox[1] for board in self.boards),
+                max(board.papergames_manager.bbox[2] for board in self.boards),
+                max(board.papergames_manager.bbox[3] for board in self.boards)
+            )
+            if screen_capture is None or screen_capture.bbox != bbox:
+                screen_capture = ScreenCapture(self.capture_backend, bbox)
+
+            # Board threads replace their watcher between games, so each one is read once
+            watching = [
+                (board, board.move_watcher) for board in self.boards
+                if board.move_watcher is not None and board.move_watcher.is_watching()
+            ]
+            if not watching:
+                time.sleep(self.min_interval)
+                continue
+
+            poll_start = time.monotonic()
+            try:
+                gray = screen_capture.tick()
+            except ValueError as e:
+                self.logger.error(f"ValueError: {e}")
+                time.sleep(self.max_interval)
+                continue
+
+            for board, move_watcher in watching:
+                board_state = board.papergames_manager.detect(
+                    screen_capture.view(board.papergames_manager.bbox, gray)
+                )
+                move_watcher.check(board_state, poll_start, time.monotonic())
+
+                if board.papergames_manager.needs_relocation():
+                    board.papergames_manager.relocate()
+
+            self._polls += 1
+            self._cpu_time = time.thread_time() - cpu_start
+
+            time.sleep(min(move_watcher.interval for _, move_watcher in watching))
+
+    def metrics(self) -> dict:
+        hours = (time.monotonic() - self._start_time) / 3600
+
+        boards = {
+            board.name: {
+                'games': board.games,
+                'games_per_hour': board.games / hours if hours > 0 else 0.0,
+                'moves': len(board.move_latencies),
+                'mean_move_latency': float(np.mean(board.move_latencies)) if board.move_latencies else 0.0,
+                'click_conflicts': board.click_conflicts
+            }
+            for board in self.boards
+        }
+
+        move_latencies = [latency for board in self.boards for latency in board.move_latencies]
+        games = sum(board.games for board in self.boards)
+
+        return {
+            'boards': boards,
+            'games': games,
+            'games_per_hour': games / hours if hours > 0 else 0.0,
+            'moves': len(move_latencies),
+            'mean_move_latency': float(np.mean(move_latencies)) if move_latencies else 0.0,
+            'click_conflicts': sum(board.click_conflicts for board in self.boards),
+            'polls': self._polls,
+            'cpu_duty_cycle': self._cpu_time / (hours * 3600) if hours > 0 else 0.0
+        }
+
+    def log_metrics(self):
+        metrics = self.metrics()
+
+        for name, board_metrics in metrics['boards'].items():
+            self.logger.info(
+                f"Board {name}: {board_metrics['games']} games ({board_metrics['games_per_hour']:.1f}/h), "
+                f"{board_metrics['moves']} moves, "
+                f"mean move latency {board_metrics['mean_move_latency'] * 1000:.0f} ms, "
+                f"{board_metrics['click_conflicts']} click conflicts"
+            )
+
+        self.logger.info(
+            f"All boards: {metrics['games']} games ({metrics['games_per_hour']:.1f}/h), "
+            f"{metrics['moves']} moves, mean move latency {metrics['mean_move_latency'] * 1000:.0f} ms, "
+            f"{metrics['click_conflicts']} click conflicts, {metrics['polls']} polls, "
+            f"CPU duty cycle {metrics['cpu_duty_cycle'] * 100:.1f}%"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play on several papergames.io boards at once.')
+    parser.add_argument('config', type=Path, help='JSON file with the pbrain settings and a list of boards')
+    parser.add_argument('--debug', action='store_true', help='log at debug level')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.INFO,
+        format='%(asctime)s %(name)s %(levelname)s %(message)s'
+    )
+    logger = logging.getLogger('multi_board')
+
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+
+    run_config(logger, config)
+
+
+def run_config(logger: logging.Logger, config: dict):
+    move_cache = None
+    if config['pbrain'].get('move_cache_path'):
+        move_cache = MoveCache(logger, Path(config['pbrain']['move_cache_path']))
+
+    opening_book = None
+    if config['pbrain'].get('opening_book_path'):
+        opening_book = OpeningBook(logger, Path(config['pbrain']['opening_book_path']))
+
+    brain_pool = BrainPool(
+        logger,
+        Path(config['pbrain']['path']),
+        config['pbrain']['timeout_turn'],
+        size=len(config['boards']),
+        ponder=config['pbrain'].get('ponder', False),
+        move_cache=move_cache,
+        opening_book=opening_book,
+        timeout_match=config['pbrain'].get('timeout_match', 0.0),
+        parallel_paths=[Path(path) for path in config['pbrain'].get('parallel_paths', [])]
+    )
+    brain_pool.warm_up()
+
+    recorder = None
+    if config.get('record_path'):
+        recorder = GameRecorder(logger, Path(config['record_path']))
+
+    scheduler = MultiBoardScheduler(
+        logger,
+        brain_pool,
+        config['turn_wait_time'],
+        recorder=recorder,
+        relocate=config.get('relocate', False),
+        screen_size=tuple(config['screen_size']) if config.get('screen_size') else None,
+        board_sync=config.get('board_sync', True)
+    )
+
+    trace_path = config.get('trace_path')
+    trace_reporter = TraceReporter(logger, path=Path(trace_path) if trace_path else None)
+    trace_reporter.start()
+
+    for board in config['boards']:
+        scheduler.add_board(
+            board['name'],
+            (board['left_top']['x'], board['left_top']['y']),
+            (board['right_bottom']['x'], board['right_bottom']['y']),
+            board.get('is_first_move', False)
+        )
+
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        logger.info('Stop!')
+    finally:
+        brain_pool.close()
+
+        if move_cache is not None:
+            move_cache.save()
+
+        if opening_book is not None:
+            opening_book.close()
+
+        if recorder is not None:
+            recorder.close()
+
+        trace_reporter.stop()
+
+
+if __name__ == '__main__':
+    main()
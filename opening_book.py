@@ -0,0 +1,158 @@
+import argparse
+import logging
+import mmap
+import random
+import struct
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+import game_recorder
+from move_cache import SYMMETRIES, INVERSE_SYMMETRIES, canonical_hash
+from piskvork_client import OWN, OPPONENT
+
+MAGIC = b'PGOB'
+VERSION = 1
+HEADER = struct.Struct('<4sBBxxI')
+CANDIDATES = 4
+SLOT_DTYPE = np.dtype([
+    ('hash', '<u8'),
+    ('x', 'u1', (CANDIDATES,)),
+    ('y', 'u1', (CANDIDATES,)),
+    ('weight', '<u2', (CANDIDATES,))
+])
+
+
+class OpeningBook:
+    def __init__(self, logger: logging.Logger, path: Path):
+        self.logger = logger
+        self.path = path
+
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.max_ply, slot_count = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not an opening book: {path}")
+
+        # An open addressing hash table read straight from the mapped file, a slot is used when its first
+        # candidate has a weight
+        self._slots = np.frombuffer(self._mmap, dtype=SLOT_DTYPE, count=slot_count, offset=HEADER.size)
+        self._mask = slot_count - 1
+
+        self.logger.info(f"Opening book {path}: {slot_count} slots, up to ply {self.max_ply}")
+
+    def candidates(self, moves: list) -> list[tuple[tuple[int, int], int]]:
+        if len(moves) >= self.max_ply:
+            return []
+
+        position_hash, symmetry = canonical_hash(moves)
+        inverse = SYMMETRIES[INVERSE_SYMMETRIES[symmetry]]
+
+        index = position_hash & self._mask
+        while True:
+            slot = self._slots[index]
+            if slot['weight'][0] == 0:
+                return []
+
+            if int(slot['hash']) == position_hash:
+                return [
+                    (inverse(int(x), int(y)), int(weight))
+                    for x, y, weight in zip(slot['x'], slot['y'], slot['weight']) if weight > 0
+                ]
+
+            index = (index + 1) & self._mask
+
+    def choose(self, moves: list) -> Optional[tuple[int, int]]:
+        candidates = self.candidates(moves)
+        if not candidates:
+            return None
+
+        return random.choices([move for move, _ in candidates], weights=[weight for _, weight in candidates])[0]
+
+    def close(self):
+        self._slots = None
+        self._mmap.close()
+
+
+def positions(game: list[tuple[int, int]], max_ply: int):
+    # Every position of the game as seen by the side to move, with the move that was played there
+    for ply in range(min(len(game), max_ply)):
+        yield [
+            (x, y, OWN if i % 2 == ply % 2 else OPPONENT) for i, (x, y) in enumerate(game[:ply])
+        ], game[ply]
+
+
+def build(games: list[list[tuple[int, int]]], path: Path, max_ply: int = 8, min_count: int = 2) -> int:
+    counts = defaultdict(Counter)
+
+    for game in games:
+        for moves, move in positions(game, max_ply):
+            position_hash, symmetry = canonical_hash(moves)
+            counts[position_hash][SYMMETRIES[symmetry](*move)] += 1
+
+    entries = {}
+    for position_hash, moves in counts.items():
+        candidates = [(move, count) for move, count in moves.most_common(CANDIDATES) if count >= min_count]
+        if candidates:
+            entries[position_hash] = candidates
+
+    # At most half full, so probes stay short
+    slot_count = 1
+    while slot_count < len(entries) * 2:
+        slot_count *= 2
+
+    slots = np.zeros(slot_count, dtype=SLOT_DTYPE)
+    mask = slot_count - 1
+    for position_hash, candidates in entries.items():
+        index = position_hash & mask
+        while slots[index]['weight'][0] != 0:
+            index = (index + 1) & mask
+
+        slots[index]['hash'] = position_hash
+        for i, ((x, y), count) in enumerate(candidates):
+            slots[index]['x'][i] = x
+            slots[index]['y'][i] = y
+            slots[index]['weight'][i] = min(count, np.iinfo(np.uint16).max)
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, max_ply, slot_count))
+        slots.tofile(f)
+
+    return len(entries)
+
+
+def read_games(path: Path) -> list[list[tuple[int, int]]]:
+    if game_recorder.is_recording(path):
+        return [game.move_coordinates() for game in game_recorder.read_games(path)]
+
+    # One game per line, moves as x,y separated by spaces
+    games = []
+
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                games.append([tuple(int(value) for value in move.split(',')) for move in line.split()])
+
+    return games
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build an opening book from recorded games.')
+    parser.add_argument(
+        'games', type=Path, help='game recording, or a text file with one game per line and moves as x,y'
+    )
+    parser.add_argument('book', type=Path, help='opening book to write')
+    parser.add_argument('--max-ply', type=int, default=8, help='number of opening moves to keep')
+    parser.add_argument('--min-count', type=int, default=2, help='times a move must be seen to be kept')
+    args = parser.parse_args()
+
+    games = read_games(args.games)
+    positions_count = build(games, args.book, args.max_ply, args.min_count)
+    print(f"{positions_count} positions from {len(games)} games written to {args.book}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,24 @@
 import logging
+import threading
+import time
+from typing import Optional, TYPE_CHECKING
 
-import pynput
-from PIL import ImageGrab, ImageDraw, ImageFont
-from PIL.ImageQt import ImageQt
-from PyQt5 import QtGui, QtCore
-from PyQt5.QtWidgets import QLabel
+import numpy as np
+
+from board_detector import BoardDetector, BoardState, IncrementalBoardDetector, EMPTY
+from board_locator import BoardLocator
+from platform_support import Mouse, default_capture_backend, default_mouse
+from screen_capture import CaptureBackend, ScreenCapture
+from tracing import TRACER
+
+if TYPE_CHECKING:
+    # Only the GUI shows a preview, so headless runs never load Qt
+    from debug_preview import DebugPreview
+
+# Below this share of grid line points seen, the board is taken to have moved
+MIN_GRID_CONFIDENCE = 0.8
+RELOCATE_AFTER_FRAMES = 3
+RELOCATE_INTERVAL = 2.0
 
 
 class PapergamesManager:
@@ -12,16 +26,49 @@ class PapergamesManager:
             self,
             logger: logging.Logger,
             left_top_corner_mouse: tuple,
-            right_bottom_corner_mouse: tuple
+            right_bottom_corner_mouse: tuple,
+            incremental: bool = False,
+            capture_backend: CaptureBackend = None,
+            debug_preview: 'DebugPreview' = None,
+            mouse: Mouse = None,
+            locator: BoardLocator = None,
+            screen_size: tuple[int, int] = None
     ):
         self.logger = logger
+        self.incremental = incremental
+        self.debug_preview = debug_preview
+        self.capture_backend = capture_backend if capture_backend is not None else default_capture_backend()
+        # The board thread and a poller shared between boards both detect, and the incremental detector keeps state
+        self._detect_lock = threading.Lock()
 
+        self.set_corners(left_top_corner_mouse, right_bottom_corner_mouse)
+
+        # Finds the board again when the grid is no longer where it was, after a scroll or a zoom
+        self.locator = locator
+        self.screen_size = screen_size
+        self.relocations = 0
+        self._low_confidence_frames = 0
+        self._last_relocation = 0.0
+
+        self.mouse = mouse if mouse is not None else default_mouse()
+        self.original_mouse_position = self.mouse.position
+
+    def set_corners(self, left_top_corner_mouse: tuple, right_bottom_corner_mouse: tuple):
         self.left_top_corner_mouse = left_top_corner_mouse
         self.right_bottom_corner_mouse = right_bottom_corner_mouse
         self.square_size_mouse = (right_bottom_corner_mouse[0] - left_top_corner_mouse[0]) / 16
 
-        self.mouse = pynput.mouse.Controller()
-        self.original_mouse_position = self.mouse.position
+        if self.incremental:
+            # Only intersections that changed since the last frame are re-classified. Every probe is still sampled,
+            # so it saves next to nothing over a full detection, and it is kept for comparison in benchmarks
+            detector = IncrementalBoardDetector(self.square_size_mouse)
+        else:
+            detector = BoardDetector(self.square_size_mouse)
+
+        with self._detect_lock:
+            self.detector = detector
+
+        self.screen_capture = ScreenCapture(self.capture_backend, self.bbox)
 
     def move(self, x: int, y: int):
         self.mouse.position = (
@@ -29,54 +76,135 @@ class PapergamesManager:
             self.left_top_corner_mouse[1] + (y + 1) * self.square_size_mouse
         )
 
-        # noinspection PyTypeChecker
-        self.mouse.click(pynput.mouse.Button.left)
+        self.mouse.click()
         self.logger.debug(f"Click: {self.mouse.position}")
 
     def mouse_to_original_position(self):
         self.mouse.position = self.original_mouse_position
         self.logger.debug("Mouse to original position.")
 
-    def get_last_move(self, label: QLabel = None) -> tuple[int, int]:
+    def reset_detector(self):
+        with self._detect_lock:
+            if isinstance(self.detector, IncrementalBoardDetector):
+                self.logger.debug(
+                    f"Detector scans: {self.detector.full_scans} full, {self.detector.incremental_scans} incremental"
+                )
+                self.detector.reset()
+
+    def get_board_state(self) -> Optional[BoardState]:
+        if self.needs_relocation():
+            self.relocate()
+
         try:
-            image = ImageGrab.grab(bbox=(
-                self.left_top_corner_mouse[0],
-                self.left_top_corner_mouse[1],
-                self.right_bottom_corner_mouse[0],
-                self.right_bottom_corner_mouse[1]
-            )).convert('L').point(lambda p: 255 if p > 200 else 0)
+            gray = self.screen_capture.tick()
         except ValueError as e:
             self.logger.error(f"ValueError: {e}")
-            self.logger.debug("No move found.")
-            return -1, -1
+            return None
+
+        return self.detect(gray)
+
+    @property
+    def bbox(self) -> tuple[int, int, int, int]:
+        return (
+            self.left_top_corner_mouse[0],
+            self.left_top_corner_mouse[1],
+            self.right_bottom_corner_mouse[0],
+            self.right_bottom_corner_mouse[1]
+        )
+
+    def detect(self, gray: np.ndarray) -> Optional[BoardState]:
+        with self._detect_lock:
+            try:
+                with TRACER.span('detect'):
+                    board_state = self.detector.detect(gray)
+            except IndexError as e:
+                self.logger.error(f"IndexError: {e}")
+                return None
+
+            grid_confidence = self.detector.grid_confidence(gray) if self.locator is not None else 1.0
+
+        x, y = board_state.last_move
+        if x != -1:
+            self.logger.debug(f"Found last move: {x}, {y}")
+
+        if self.debug_preview is not None:
+            self.debug_preview.publish(gray, board_state)
 
-        if label is not None:
-            label.setPixmap(QtGui.QPixmap.fromImage(ImageQt(image)).scaledToWidth(
-                350, mode=QtCore.Qt.SmoothTransformation
-            ))
+        if self.locator is not None:
+            if grid_confidence < MIN_GRID_CONFIDENCE:
+                self._low_confidence_frames += 1
+            else:
+                self._low_confidence_frames = 0
+
+        return board_state
+
+    def needs_relocation(self) -> bool:
+        return (
+            self.locator is not None and
+            self._low_confidence_frames >= RELOCATE_AFTER_FRAMES and
+            time.monotonic() - self._last_relocation > RELOCATE_INTERVAL
+        )
+
+    def relocate(self) -> bool:
+        # Searches around the old position only, at most one board width away, which keeps it quick
+        self._last_relocation = time.monotonic()
+
+        width = self.right_bottom_corner_mouse[0] - self.left_top_corner_mouse[0]
+        left, top, right, bottom = self.bbox
+        area = (max(left - width, 0), max(top - width, 0), right + width, bottom + width)
+        if self.screen_size is not None:
+            area = (area[0], area[1], min(area[2], self.screen_size[0]), min(area[3], self.screen_size[1]))
 
         try:
-            for x in range(15):
-                for y in range(15):
-                    if image.getpixel(
-                            ((x + 1) * self.square_size_mouse, (y + 1) * self.square_size_mouse)
-                    ) == 255 and image.getpixel(
-                        ((x + 1.2) * self.square_size_mouse, (y + 1.2) * self.square_size_mouse)
-                    ) == 0:
-                        self.logger.debug(f"Found last move: {x}, {y}")
-
-                        if label is not None:
-                            image_draw = ImageDraw.Draw(image)
-                            font = ImageFont.truetype('NotoSans-Regular.ttf', 64)
-                            image_draw.text((0, 0), f"{x},{y}", fill=0, font=font)
-
-                            label.setPixmap(QtGui.QPixmap.fromImage(ImageQt(image)).scaledToWidth(
-                                350, mode=QtCore.Qt.SmoothTransformation
-                            ))
-
-                        return x, y
-        except IndexError as e:
-            self.logger.error(f"IndexError: {e}")
-
-        self.logger.debug("No move found.")
-        return -1, -1
+            with TRACER.span('locate'):
+                gray = ScreenCapture(self.capture_backend, area, trace_name='capture_locate').tick()
+                location = self.locator.locate(gray, area[:2])
+        except ValueError as e:
+            self.logger.error(f"ValueError: {e}")
+            return False
+
+        if location is None:
+            self.logger.debug('Board lost, and not found again nearby.')
+            return False
+
+        if (location.left_top, location.right_bottom) != (self.left_top_corner_mouse, self.right_bottom_corner_mouse):
+            self.logger.warning(f"Board moved to {location.left_top} - {location.right_bottom}.")
+            self.set_corners(location.left_top, location.right_bottom)
+            self.relocations += 1
+
+        self._low_confidence_frames = 0
+        return True
+
+    def wait_for_stone(self, x: int, y: int, timeout: float = 0.5, interval: float = 0.01) -> bool:
+        # Watches only the clicked intersection, a patch small enough to grab many times a second
+        left, top, right, bottom = self.detector.cell_bbox(x, y)
+        cell_capture = ScreenCapture(
+            self.capture_backend,
+            (self.bbox[0] + left, self.bbox[1] + top, self.bbox[0] + right, self.bbox[1] + bottom),
+            trace_name='capture_cell'
+        )
+
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                color, _ = self.detector.detect_cell(cell_capture.tick(), x, y)
+            except ValueError as e:
+                self.logger.error(f"ValueError: {e}")
+                return False
+
+            if color != EMPTY:
+                return True
+
+            if time.monotonic() >= deadline:
+                self.logger.debug(f"No stone at {(x, y)} after {timeout}s.")
+                return False
+
+            time.sleep(interval)
+
+    def get_last_move(self) -> tuple[int, int]:
+        board_state = self.get_board_state()
+        if board_state is None or board_state.last_move == (-1, -1):
+            self.logger.debug("No move found.")
+            return -1, -1
+
+        return board_state.last_move
@@ -0,0 +1,319 @@
+import asyncio
+import logging
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+from gomoku_engine import BUILTIN_BRAIN, EngineClient
+from piskvork_client import AsyncPiskvorkClient, BrainError, OK, OWN, OPPONENT
+
+# How long after the turn timeout slower brains are still waited for, once one brain has answered
+STRAGGLER_GRACE = 0.5
+RESPAWN_TIMEOUT = 30.0
+
+
+def client_for(logger: logging.Logger, pbrain_path: Path) -> AsyncPiskvorkClient:
+    # The built-in engine runs in this process, any other path is a pbrain executable
+    return EngineClient(logger) if str(pbrain_path) == BUILTIN_BRAIN else AsyncPiskvorkClient(logger)
+
+
+class SearchWorker:
+    def __init__(self, pbrain_path: Path):
+        self.pbrain_path = pbrain_path
+        self.client = None
+        self.ready = False
+        # Set while the brain is started again, it sits out every command until then
+        self.restarting = False
+        # A search that was outvoted before it finished. Its answer is thrown away, and the brain sits out searches
+        # until then.
+        self.late_search = None
+
+    def is_alive(self) -> bool:
+        return self.client is not None and self.client.proc is not None and self.client.proc.returncode is None
+
+    def is_searching(self) -> bool:
+        return self.late_search is not None and not self.late_search.done()
+
+
+class WorkerGroup:
+    # Stands in for the brain process: the group is alive as long as one of its brains is
+    def __init__(self, workers: list):
+        self.workers = workers
+
+    @property
+    def returncode(self) -> Optional[int]:
+        if any(worker.is_alive() for worker in self.workers):
+            return None
+
+        primary = self.workers[0].client
+        return primary.proc.returncode if primary is not None and primary.proc is not None else -1
+
+
+class ParallelClient:
+    # Searches every position on several brains at once and plays the move most of them agree on. Each brain is
+    # given the whole board every time, so a brain restarted in the middle of a game can join the next search.
+
+    def __init__(self, logger: logging.Logger, parallel_paths: list):
+        self.logger = logger
+        self.parallel_paths = list(parallel_paths)
+
+        self.workers = []
+        self.proc = None
+
+        # Replayed to brains started again after they were cancelled
+        self._start_kwargs = {}
+        self._start_str = None
+        self._info_strs = {}
+        self._respawns = set()
+        self._closed = False
+
+        # The position the brains are searching, from the brain's point of view
+        self.moves = []
+        self.timeout_turn = 0.0
+        self._reading_board = False
+
+        self.searches = 0
+        self.split_votes = 0
+        self.stragglers = 0
+
+    def new_game(self):
+        self.searches = 0
+        self.split_votes = 0
+        self.stragglers = 0
+
+    async def start(self, pbrain_path: Path, **kwargs):
+        self._start_kwargs = kwargs
+        self.workers = [SearchWorker(path) for path in [pbrain_path] + self.parallel_paths]
+        self.proc = WorkerGroup(self.workers)
+
+        for worker in self.workers:
+            worker.client = client_for(self.logger, worker.pbrain_path)
+            try:
+                await worker.client.start(worker.pbrain_path, **kwargs)
+            except FileNotFoundError:
+                self.logger.error(f"Piskvork brain not found in {str(worker.pbrain_path)}")
+                worker.client = None
+
+        if not any(worker.is_alive() for worker in self.workers):
+            raise FileNotFoundError(pbrain_path)
+
+    def _remember(self, input_strs) -> list:
+        # Keeps track of the settings and the position, returns the settings among the input
+        info_strs = []
+
+        for input_str in input_strs:
+            command, _, arguments = input_str.partition(' ')
+            if command == 'INFO':
+                key, _, value = arguments.partition(' ')
+                self._info_strs[key] = input_str
+                if key == 'timeout_turn':
+                    self.timeout_turn = int(value) / 1000
+                info_strs.append(input_str)
+            elif command == 'START':
+                self._start_str = input_str
+                self.moves = []
+            elif command in ('RESTART', 'BEGIN'):
+                self.moves = []
+            elif command == 'BOARD':
+                self.moves = []
+                self._reading_board = True
+            elif command == 'DONE':
+                self._reading_board = False
+            elif command == 'TURN':
+                x, y = (int(value) for value in arguments.split(','))
+                self.moves.append((x, y, OPPONENT))
+            elif self._reading_board:
+                x, y, player = (int(value) for value in input_str.split(','))
+                self.moves.append((x, y, player))
+
+        return info_strs
+
+    def _alive_workers(self) -> list:
+        return [worker for worker in self.workers if worker.is_alive() and not worker.restarting]
+
+    async def send(self, *input_strs: str):
+        self._remember(input_strs)
+
+        for worker in self._alive_workers():
+            try:
+                await worker.client.send(*input_strs)
+            except BrainError as e:
+                self.logger.warning(f"Brain {str(worker.pbrain_path)} failed: {e}")
+                self._respawn(worker)
+
+    async def command(self, input_strs: list, kinds: tuple, timeout: Optional[float]):
+        self._remember(input_strs)
+
+        # Every brain answers this one, so late searches have to be out of the way first
+        await self._settle()
+        workers = self._alive_workers()
+        results = await asyncio.gather(
+            *(worker.client.command(input_strs, kinds, timeout) for worker in workers), return_exceptions=True
+        )
+
+        event = None
+        for worker, result in zip(workers, results):
+            if isinstance(result, BrainError):
+                self.logger.warning(f"Brain {str(worker.pbrain_path)} failed: {result}")
+                self._respawn(worker)
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                worker.ready = True
+                event = event or result
+
+        if event is None:
+            raise BrainError('No brain answered')
+
+        return event
+
+    async def move(self, input_strs: list, timeout: Optional[float]) -> tuple[int, int]:
+        info_strs = self._remember(input_strs)
+        if self.moves:
+            search_strs = info_strs + ['BOARD'] + [f'{x},{y},{player}' for x, y, player in self.moves] + ['DONE']
+        else:
+            search_strs = info_strs + ['BEGIN']
+
+        workers = self._search_workers()
+        if not workers:
+            await self._settle()
+            workers = self._search_workers()
+        if not workers:
+            raise BrainError('No brain ready')
+
+        tasks = {asyncio.ensure_future(worker.client.move(search_strs, timeout)): worker for worker in workers}
+        answers = await self._gather(tasks, timeout)
+
+        # Most votes wins, and between equal votes the brain listed first
+        votes = Counter(answers.values())
+        move = max(votes, key=lambda answer: (votes[answer], -min(
+            self.workers.index(worker) for worker, worker_answer in answers.items() if worker_answer == answer
+        )))
+
+        self.searches += 1
+        if len(votes) > 1:
+            self.split_votes += 1
+        self.logger.debug(f"Parallel search: {move} with {votes[move]} of {len(tasks)} votes, answers {dict(votes)}")
+
+        self.moves.append((move[0], move[1], OWN))
+        return move
+
+    def _search_workers(self) -> list:
+        return [worker for worker in self._alive_workers() if worker.ready and not worker.is_searching()]
+
+    async def _settle(self):
+        # Waits for the late searches, which give up by themselves once their own deadline has passed
+        late_searches = [worker.late_search for worker in self.workers if worker.is_searching()]
+        if late_searches:
+            await asyncio.wait(late_searches)
+
+    async def _gather(self, tasks: dict, timeout: Optional[float]) -> dict:
+        # Waits for every brain, or for a move that has most of the votes whatever the rest say. Once one brain has
+        # answered, the others get until the turn timeout and a short grace.
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        hard_deadline = start_time + timeout if timeout is not None else None
+        soft_deadline = start_time + self.timeout_turn + STRAGGLER_GRACE if self.timeout_turn else hard_deadline
+
+        answers = {}
+        pending = set(tasks)
+        while pending:
+            deadline = soft_deadline if answers else hard_deadline
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=None if deadline is None else max(deadline - loop.time(), 0),
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                break
+
+            for task in done:
+                worker = tasks[task]
+                try:
+                    answers[worker] = task.result()
+                except BrainError as e:
+                    self.logger.warning(f"Brain {str(worker.pbrain_path)} failed: {e}")
+                    self._respawn(worker)
+
+            if answers and Counter(answers.values()).most_common(1)[0][1] * 2 > len(tasks):
+                break
+
+        # Brains still searching cannot be interrupted. They are left to finish and their answer is thrown away,
+        # only one that misses the deadline of the move is started again.
+        for task in pending:
+            self.stragglers += 1
+            self._finish_late(tasks[task], task)
+
+        if not answers:
+            raise BrainError(f"No brain answered within {timeout:.1f}s" if timeout is not None else 'No brain answered')
+
+        return answers
+
+    def _finish_late(self, worker: SearchWorker, task: asyncio.Future):
+        worker.late_search = task
+
+        def finished(_):
+            if worker.late_search is task:
+                worker.late_search = None
+
+            if task.cancelled() or self._closed:
+                return
+
+            if task.exception() is not None:
+                self.logger.warning(f"Brain {str(worker.pbrain_path)} failed: {task.exception()}")
+                self._respawn(worker)
+            else:
+                self.logger.debug(f"Late answer {task.result()} of brain {str(worker.pbrain_path)} thrown away")
+
+        task.add_done_callback(finished)
+
+    def _respawn(self, worker: SearchWorker):
+        worker.ready = False
+        worker.restarting = True
+
+        task = asyncio.ensure_future(self._restart_worker(worker))
+        self._respawns.add(task)
+        task.add_done_callback(self._respawns.discard)
+
+    async def _restart_worker(self, worker: SearchWorker):
+        try:
+            await self._replace_client(worker)
+        finally:
+            worker.restarting = False
+
+    async def _replace_client(self, worker: SearchWorker):
+        await worker.client.kill()
+        if self._closed:
+            return
+
+        worker.client = client_for(self.logger, worker.pbrain_path)
+        try:
+            await worker.client.start(worker.pbrain_path, **self._start_kwargs)
+            if self._info_strs:
+                await worker.client.send(*self._info_strs.values())
+            await worker.client.command([self._start_str], (OK,), RESPAWN_TIMEOUT)
+        except (FileNotFoundError, BrainError) as e:
+            self.logger.warning(f"Fail to restart brain {str(worker.pbrain_path)}: {e}")
+            await worker.client.kill()
+            return
+
+        if self._closed:
+            await worker.client.kill()
+            return
+
+        worker.ready = True
+        self.logger.debug(f"Brain {str(worker.pbrain_path)} restarted")
+
+    async def kill(self):
+        self._closed = True
+
+        for task in list(self._respawns):
+            task.cancel()
+
+        for worker in self.workers:
+            if worker.is_searching():
+                worker.late_search.cancel()
+
+        for worker in self.workers:
+            if worker.client is not None:
+                await worker.client.kill()
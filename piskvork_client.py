@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+
+OK = 'OK'
+MOVE = 'MOVE'
+MESSAGE = 'MESSAGE'
+DEBUG = 'DEBUG'
+ERROR = 'ERROR'
+UNKNOWN = 'UNKNOWN'
+OTHER = 'OTHER'
+CLOSED = 'CLOSED'
+
+# Stone owners in BOARD commands, from the brain's point of view
+OWN = 1
+OPPONENT = 2
+
+KILL_TIMEOUT = 1.0
+
+
+class BrainError(Exception):
+    pass
+
+
+class BrainEvent:
+    def __init__(self, kind: str, text: str, move: tuple[int, int] = None):
+        self.kind = kind
+        self.text = text
+        self.move = move
+
+
+def parse_output(output_str: str) -> BrainEvent:
+    output_str = output_str.strip()
+
+    output_str_split = output_str.split(',')
+    if len(output_str_split) == 2 and output_str_split[0].isdigit() and output_str_split[1].isdigit():
+        return BrainEvent(MOVE, output_str, (int(output_str_split[0]), int(output_str_split[1])))
+
+    keyword, _, text = output_str.partition(' ')
+    if keyword in (OK, MESSAGE, DEBUG, ERROR, UNKNOWN):
+        return BrainEvent(keyword, text)
+
+    # Some brains decorate the OK line
+    if OK in output_str:
+        return BrainEvent(OK, output_str)
+
+    return BrainEvent(OTHER, output_str)
+
+
+class AsyncPiskvorkClient:
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+
+        self.proc = None
+        self._events = None
+        self._reader = None
+
+    async def start(self, pbrain_path: Path, **kwargs):
+        self.proc = await asyncio.create_subprocess_exec(
+            str(pbrain_path),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            **kwargs
+        )
+
+        self._events = asyncio.Queue()
+        self._reader = asyncio.ensure_future(self._read_events())
+
+    async def _read_events(self):
+        while True:
+            output = await self.proc.stdout.readline()
+            if not output:
+                await self._events.put(BrainEvent(CLOSED, ''))
+                return
+
+            output_str = output.decode('utf-8', errors='replace')
+            self.logger.debug(f"Brain output: {output_str.strip()}")
+
+            event = parse_output(output_str)
+            if event.kind == ERROR:
+                self.logger.error(f"Brain error: {event.text}")
+
+            await self._events.put(event)
+
+    async def send(self, *input_strs: str):
+        if self.proc.returncode is not None:
+            raise BrainError(f"Brain exited with code {self.proc.returncode}")
+
+        try:
+            for input_str in input_strs:
+                self.proc.stdin.write((input_str + '\r\n').encode('utf-8'))
+                self.logger.debug(f"Brain input: {input_str}")
+
+            await self.proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise BrainError(f"Brain input closed: {e}")
+
+    async def expect(self, kinds: tuple, timeout: Optional[float]) -> BrainEvent:
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    self._events.get(), None if deadline is None else max(deadline - loop.time(), 0)
+                )
+            except asyncio.TimeoutError:
+                raise BrainError(f"No {'/'.join(kinds)} from brain within {timeout:.1f}s")
+
+            if event.kind in kinds:
+                return event
+
+            if event.kind == CLOSED:
+                raise BrainError('Brain closed its output')
+
+            # The brain rejected the command, so no answer is coming
+            if event.kind in (ERROR, UNKNOWN):
+                raise BrainError(f"Brain {event.kind.lower()}: {event.text}")
+
+    async def command(self, input_strs: list, kinds: tuple, timeout: Optional[float]) -> BrainEvent:
+        await self.send(*input_strs)
+
+        return await self.expect(kinds, timeout)
+
+    async def move(self, input_strs: list, timeout: Optional[float]) -> tuple[int, int]:
+        return (await self.command(input_strs, (MOVE,), timeout)).move
+
+    async def kill(self):
+        if self.proc is not None and self.proc.returncode is None:
+            self.proc.kill()
+
+            try:
+                await asyncio.wait_for(self.proc.wait(), KILL_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.logger.warning('Brain output still open after kill.')
+
+        if self._reader is not None:
+            self._reader.cancel()
+
+
+_shared_loop = None
+_shared_loop_lock = threading.Lock()
+
+
+def shared_event_loop() -> asyncio.AbstractEventLoop:
+    # One loop on a background thread drives every brain of the process
+    global _shared_loop
+
+    with _shared_loop_lock:
+        if _shared_loop is None:
+            _shared_loop = asyncio.new_event_loop()
+            threading.Thread(target=_shared_loop.run_forever, daemon=True).start()
+
+    return _shared_loop
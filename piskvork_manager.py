@@ -1,67 +1,352 @@
+import asyncio
 import logging
-import subprocess
+import threading
+import time
 from pathlib import Path
+from typing import Optional
+
+from move_cache import MoveCache
+from opening_book import OpeningBook
+from parallel_search import ParallelClient, client_for
+from piskvork_client import BrainError, OK, OWN, OPPONENT, shared_event_loop
+from platform_support import brain_process_options
+from time_manager import TimeManager
+from tracing import TRACER
+
+# Brains loading large pattern tables or weights need a while before they answer START
+START_TIMEOUT = 30.0
+# How long a brain may overrun its turn timeout before it is considered hung
+MOVE_TIMEOUT_MARGIN = 5.0
+# Without a turn timeout the brain keeps its own limits, a brain thinking longer than this is considered hung
+FALLBACK_MOVE_TIMEOUT = 120.0
+# Cached moves are only played when they were searched for at least this share of the time this move would get
+CACHE_MIN_SEARCH_SHARE = 0.5
+# Share of the turn timeout the pondering brain spends guessing the opponent's reply, the rest is left to answering it
+PREDICTION_SHARE = 0.2
 
 
 class PiskvorkManager:
-    def __init__(self, logger: logging.Logger, pbrain_path: Path, timeout_turn: float):
+    def __init__(
+            self,
+            logger: logging.Logger,
+            pbrain_path: Path,
+            timeout_turn: float,
+            ponder: bool = False,
+            loop: asyncio.AbstractEventLoop = None,
+            move_cache: MoveCache = None,
+            opening_book: OpeningBook = None,
+            timeout_match: float = 0.0,
+            parallel_paths: list = None
+    ):
         self.logger = logger
 
-        startupinfo = subprocess.STARTUPINFO()
-        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        self.loop = loop if loop is not None else shared_event_loop()
+        # With parallel brains every search runs on all of them, and they vote on the move
+        self.parallel = ParallelClient(logger, parallel_paths) if parallel_paths else None
+        self.client = self.parallel if self.parallel is not None else client_for(logger, pbrain_path)
+        self.move_timeout = timeout_turn + MOVE_TIMEOUT_MARGIN if timeout_turn != 0 else FALLBACK_MOVE_TIMEOUT
+        self.time_manager = TimeManager(logger, timeout_turn, timeout_match)
+
+        # Every stone on the board in the order it was played, as (x, y, OWN or OPPONENT)
+        self.moves = []
+        # False when moves were played without the brain, so it has to be sent the whole board again
+        self.synced = True
+        # True while the brain still has a turn timeout given for a single search
+        self.timeout_overridden = False
+        self.ponderer = None
+
+        self.opening_book = opening_book
+        self.book_hits = 0
+
+        self.move_cache = move_cache
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        # Set when a game starts, cleared once the first move of that game has been answered
+        self.start_time = time.monotonic()
+        self.startup_latency = None
 
         try:
-            self.proc = subprocess.Popen(
-                str(pbrain_path),
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                startupinfo=startupinfo
-            )
+            self._run(self.client.start(pbrain_path, **brain_process_options()))
         except FileNotFoundError:
             self.logger.error(f"Piskvork brain not found in {str(pbrain_path)}")
             self.proc = None
             return
 
-        if timeout_turn != 0:
-            # Set timeout for a turn
-            self._write_input(f"INFO timeout_turn {int(timeout_turn * 1000)}")
-
-        # Start a 15x15 game
-        self._write_input('START 15')
-
-        # Check if piskvork brain started successfully
-        for i in range(5):
-            output_str = self.proc.stdout.readline().decode('utf-8')
-            self.logger.debug(f"Brain output: {output_str.strip()}")
-            if "OK" in output_str:
-                self.logger.info('Piskvork brain OK!')
-                return
-
-        self.logger.error(f"Fail to start piskvork brain in {str(pbrain_path)}.")
-        self.proc = None
-
-    def _write_input(self, input_str: str) -> None:
-        self.proc.stdin.write((input_str + '\r\n').encode('utf-8'))
-        self.proc.stdin.flush()
-        self.logger.debug(f"Brain input: {input_str}")
-
-    def _read_move_output(self) -> tuple[int, int]:
-        while True:
-            output_str = self.proc.stdout.readline().decode('utf-8')
-            self.logger.debug(f"Brain output: {output_str.strip()}")
-            output_str_split = output_str.strip().split(',')
-            if len(output_str_split) == 2 and output_str_split[0].isdigit() and output_str_split[1].isdigit():
-                return int(output_str_split[0]), int(output_str_split[1])
+        self.proc = self.client.proc
+
+        try:
+            if timeout_turn != 0:
+                # Set timeout for a turn
+                self._run(self.client.send(f"INFO timeout_turn {int(timeout_turn * 1000)}"))
+
+            if timeout_match != 0:
+                self._run(self.client.send(f"INFO timeout_match {int(timeout_match * 1000)}"))
+
+            # Start a 15x15 game and check if piskvork brain started successfully
+            self._run(self.client.command(['START 15'], (OK,), START_TIMEOUT))
+        except BrainError as e:
+            self.logger.error(f"Fail to start piskvork brain in {str(pbrain_path)}: {e}")
+            self._run(self.client.kill())
+            self.proc = None
+            return
+
+        self.logger.info('Piskvork brain OK!')
+
+        if ponder:
+            # Searches of the pondering brain fill the same cache, and skip the same book moves
+            self.ponderer = Ponderer(
+                self.logger,
+                PiskvorkManager(
+                    self.logger, pbrain_path, timeout_turn, loop=loop, move_cache=move_cache, opening_book=opening_book
+                )
+            )
+            if self.ponderer.brain.proc is None:
+                self.logger.warning('Fail to start pondering brain, pondering disabled.')
+                self.ponderer = None
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def _move(self, input_strs: list, move_timeout: Optional[float]) -> tuple[int, int]:
+        try:
+            with TRACER.span('think'):
+                return self._run(self.client.move(input_strs, move_timeout))
+        except BrainError:
+            # A brain that missed its deadline or rejected the command cannot be trusted with the game any more
+            self.kill()
+            raise
 
     def begin(self) -> tuple[int, int]:
-        self._write_input('BEGIN')
+        answer = self._cached_move()
+        if answer is None:
+            answer = self._search(['BEGIN'])
 
-        return self._read_move_output()
+        self._report_startup_latency()
+        self._start_pondering()
+
+        return answer
 
     def get_move(self, x: int, y: int) -> tuple[int, int]:
-        self._write_input(f'TURN {x},{y}')
+        self.moves.append((x, y, OPPONENT))
+
+        answer = self._cached_move()
+
+        if answer is None and self.ponderer is not None:
+            answer = self.ponderer.answer(self.moves)
+            if answer is not None:
+                self.logger.info(f"Ponder hit: {(x, y)}")
+                self._play_without_brain(answer)
+
+        if answer is None:
+            if self.synced:
+                answer = self._search([f'TURN {x},{y}'])
+            else:
+                answer = self._search(self._board_input())
+
+        self._report_startup_latency()
+        self._start_pondering()
+
+        return answer
+
+    def board(self, moves: list, budget: float = None) -> tuple[int, int]:
+        self.moves = list(moves)
+
+        answer = self._cached_move()
+        if answer is None:
+            answer = self._search(self._board_input(), budget)
+
+        self._start_pondering()
+
+        return answer
+
+    def _board_input(self) -> list:
+        return ['BOARD'] + [f'{x},{y},{player}' for x, y, player in self.moves] + ['DONE']
+
+    def _search(self, input_strs: list, budget: float = None) -> tuple[int, int]:
+        # The time manager decides how long this move may take and tells the brain right before the search, unless
+        # the caller gave a budget of its own
+        self.time_manager.searched()
+        move_timeout = self.move_timeout
+        timeout_overridden = budget is not None
+        if budget is None:
+            budget = self.time_manager.budget(self.moves)
+        if budget is not None:
+            input_strs = self.time_manager.info(budget) + input_strs
+            move_timeout = budget + MOVE_TIMEOUT_MARGIN
+        elif self.timeout_overridden:
+            input_strs = [f"INFO timeout_turn {int(self.time_manager.timeout_turn * 1000)}"] + input_strs
+        self.timeout_overridden = timeout_overridden
+
+        start_time = time.monotonic()
+        x, y = self._move(input_strs, move_timeout)
+
+        if self.move_cache is not None:
+            # The time the brain was given, a brain that answers early has seen enough
+            if budget is not None:
+                search_time = budget
+            elif self.time_manager.timeout_turn != 0:
+                search_time = self.time_manager.timeout_turn
+            else:
+                search_time = time.monotonic() - start_time
+            self.move_cache.put(self.moves, (x, y), search_time)
+
+        self.moves.append((x, y, OWN))
+        self.synced = True
+
+        return x, y
+
+    def _cached_move(self) -> Optional[tuple[int, int]]:
+        if self.opening_book is not None:
+            answer = self.opening_book.choose(self.moves)
+            if answer is not None:
+                self.book_hits += 1
+                self.logger.debug(f"Book move: {answer}")
+                self._play_without_brain(answer)
+
+                return answer
 
-        return self._read_move_output()
+        if self.move_cache is None:
+            return None
+
+        planned_budget = self.time_manager.planned_budget(self.moves)
+        answer = self.move_cache.get(
+            self.moves, planned_budget * CACHE_MIN_SEARCH_SHARE if planned_budget is not None else 0.0
+        )
+        if answer is None:
+            self.cache_misses += 1
+            return None
+
+        self.cache_hits += 1
+        self.logger.debug(f"Cache hit: {answer}")
+        self._play_without_brain(answer)
+
+        return answer
+
+    def _play_without_brain(self, answer: tuple[int, int]):
+        # The brain never saw these moves, so it is sent the whole board next time
+        self.moves.append((answer[0], answer[1], OWN))
+        self.synced = False
+
+    def is_alive(self) -> bool:
+        return self.proc is not None and self.proc.returncode is None
+
+    def restart(self) -> bool:
+        self.moves = []
+        self.synced = True
+        self.start_time = time.monotonic()
+        self.startup_latency = None
+        self.book_hits = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.time_manager.new_game()
+        if self.parallel is not None:
+            self.parallel.new_game()
+
+        if self.ponderer is not None:
+            self.ponderer.wait()
+
+        if self.ponderer is not None and not self.ponderer.brain.restart():
+            self.logger.warning('Fail to restart pondering brain, pondering disabled.')
+            self.ponderer.brain.kill()
+            self.ponderer = None
+
+        try:
+            self._run(self.client.command(['RESTART'], (OK,), START_TIMEOUT))
+        except BrainError as e:
+            self.logger.error(f"Fail to restart piskvork brain: {e}")
+            return False
+
+        return True
+
+    def _report_startup_latency(self):
+        if self.startup_latency is None:
+            self.startup_latency = time.monotonic() - self.start_time
+            self.logger.info(f"Startup to first move: {self.startup_latency:.3f}s")
+
+    def _start_pondering(self):
+        if self.ponderer is not None:
+            self.ponderer.start(self.moves)
 
     def kill(self):
-        self.proc.kill()
+        if self.ponderer is not None:
+            self.ponderer.brain.kill()
+
+        self._run(self.client.kill())
+
+
+class Ponderer:
+    def __init__(self, logger: logging.Logger, brain: PiskvorkManager):
+        self.logger = logger
+        self.brain = brain
+
+        self._thread = None
+        self._lock = threading.Lock()
+        # Answers are kept by the whole position they were searched for, so a search that was still running when
+        # the game moved on is never mistaken for an answer to the current position
+        self._predicted_position = None
+        self._answers = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def start(self, moves: list):
+        if self._thread is not None and self._thread.is_alive():
+            # The brain is still busy with the previous guess, and cannot be interrupted
+            self.logger.debug('Pondering brain busy, skipping.')
+            return
+
+        with self._lock:
+            self._predicted_position = None
+            self._answers = {}
+
+        self._thread = threading.Thread(target=self._ponder, args=(list(moves),), daemon=True)
+        self._thread.start()
+
+    def wait(self):
+        if self._thread is not None:
+            self._thread.join()
+
+    def answer(self, moves: list) -> Optional[tuple[int, int]]:
+        position = tuple(moves)
+        with self._lock:
+            predicted_position = self._predicted_position
+
+        # The right guess is already being searched, and that search started before the real reply arrived
+        if predicted_position == position and self._thread is not None:
+            self._thread.join()
+
+        with self._lock:
+            answer = self._answers.get(position)
+
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return answer
+
+    def _ponder(self, moves: list):
+        try:
+            # Ask the brain what it would play in the opponent's place. It is only a guess, so it gets a short search
+            # and the answer to it is searched while the opponent is still thinking.
+            timeout_turn = self.brain.time_manager.timeout_turn
+            predicted_move = self.brain.board(
+                [(x, y, OWN + OPPONENT - player) for x, y, player in moves],
+                timeout_turn * PREDICTION_SHARE if timeout_turn != 0 else None
+            )
+            self.logger.debug(f"Pondering on: {predicted_move}")
+
+            predicted_position = tuple(moves) + ((predicted_move[0], predicted_move[1], OPPONENT),)
+            with self._lock:
+                self._predicted_position = predicted_position
+
+            answer = self.brain.board(list(predicted_position))
+        except BrainError as e:
+            # Killing the brain at the end of a game interrupts pondering as well
+            if self.brain.is_alive():
+                self.logger.warning(f"Pondering failed: {e}")
+            return
+
+        with self._lock:
+            self._answers[predicted_position] = answer
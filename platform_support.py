@@ -0,0 +1,57 @@
+import subprocess
+import sys
+
+from screen_capture import CaptureBackend, ImageGrabBackend, MssBackend, mss
+
+IS_WINDOWS = sys.platform == 'win32'
+
+
+def scale_factor() -> float:
+    if IS_WINDOWS:
+        import ctypes
+        return ctypes.windll.shcore.GetScaleFactorForDevice(0) / 100.0
+
+    # X11 hands out unscaled pixels, and Xvfb has no scaling at all
+    return 1.0
+
+
+def brain_process_options() -> dict:
+    # Keeps console brains from opening a window of their own on Windows
+    if not IS_WINDOWS:
+        return {}
+
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+    return {'startupinfo': startupinfo}
+
+
+def default_capture_backend() -> CaptureBackend:
+    if not IS_WINDOWS and mss is not None:
+        return MssBackend()
+
+    return ImageGrabBackend()
+
+
+class Mouse:
+    # pynput clicks through SendInput on Windows and XTest on X11. It needs a display as soon as it is imported, and
+    # brains, benchmarks and tournaments run without one, so it is only imported once a real mouse is needed
+    def __init__(self):
+        import pynput
+        self._controller = pynput.mouse.Controller()
+        self._button = pynput.mouse.Button.left
+
+    @property
+    def position(self) -> tuple:
+        return self._controller.position
+
+    @position.setter
+    def position(self, position: tuple):
+        self._controller.position = position
+
+    def click(self):
+        self._controller.click(self._button)
+
+
+def default_mouse() -> Mouse:
+    return Mouse()
@@ -0,0 +1,149 @@
+import threading
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from PIL import Image, ImageGrab
+
+from tracing import TRACER
+
+try:
+    import mss
+    import mss.exception
+except ImportError:
+    mss = None
+
+
+class CaptureError(ValueError):
+    # A grab the backend could not do, such as an area partly outside of the screen. It is a ValueError like a bad
+    # bbox, so callers handle both the same way.
+    pass
+
+
+class CaptureBackend:
+    def grab(self, bbox: tuple[int, int, int, int], out: np.ndarray):
+        raise NotImplementedError
+
+    def screen_size(self) -> Optional[tuple[int, int]]:
+        # None when the backend cannot tell cheaply
+        return None
+
+
+class ImageGrabBackend(CaptureBackend):
+    def grab(self, bbox: tuple[int, int, int, int], out: np.ndarray):
+        # PIL always hands back a new image, so the grayscale result is copied into the caller's buffer
+        try:
+            image = ImageGrab.grab(bbox=bbox)
+        except OSError as e:
+            raise CaptureError(f"Fail to grab {bbox}: {e}")
+
+        np.copyto(out, np.asarray(image.convert('L')))
+
+
+class MssBackend(CaptureBackend):
+    # Grabs straight from the X server, using its shared memory extension where available, without PIL
+    def __init__(self):
+        if mss is None:
+            raise ImportError('MssBackend needs the mss package.')
+
+        # A grabber holds its own X connection and may only be used by the thread that made it
+        self._local = threading.local()
+
+    def grab(self, bbox: tuple[int, int, int, int], out: np.ndarray):
+        grabber = getattr(self._local, 'grabber', None)
+        if grabber is None:
+            grabber = self._local.grabber = mss.mss()
+
+        try:
+            screenshot = grabber.grab(
+                {'left': bbox[0], 'top': bbox[1], 'width': bbox[2] - bbox[0], 'height': bbox[3] - bbox[1]}
+            )
+        except mss.exception.ScreenShotError as e:
+            raise CaptureError(f"Fail to grab {bbox}: {e}")
+
+        bgr = np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(screenshot.height, screenshot.width, 4)[..., :3]
+        bgr = bgr.astype(np.uint32)
+
+        # The same integer weights as PIL's convert('L'), so detection thresholds behave like with ImageGrab
+        gray = (bgr[..., 2] * 19595 + bgr[..., 1] * 38470 + bgr[..., 0] * 7471 + 0x8000) >> 16
+        np.copyto(out, gray, casting='unsafe')
+
+    def screen_size(self) -> Optional[tuple[int, int]]:
+        # The first monitor of mss is all of them together
+        try:
+            with mss.mss() as grabber:
+                monitor = grabber.monitors[0]
+        except mss.exception.ScreenShotError:
+            return None
+
+        return monitor['left'] + monitor['width'], monitor['top'] + monitor['height']
+
+
+class ReplayBackend(CaptureBackend):
+    def __init__(self, screenshots: list, advance_on_grab: bool = True):
+        # Screenshots cover the whole screen, so the same bboxes work as with the real screen
+        self.frames = [
+            np.asarray(Image.open(screenshot).convert('L')) if isinstance(screenshot, (str, Path))
+            else np.asarray(screenshot)
+            for screenshot in screenshots
+        ]
+        self.advance_on_grab = advance_on_grab
+        self.index = 0
+
+    @classmethod
+    def from_directory(cls, directory: Path, advance_on_grab: bool = True) -> 'ReplayBackend':
+        return cls(sorted(directory.glob('*.png')), advance_on_grab)
+
+    def advance(self):
+        self.index = (self.index + 1) % len(self.frames)
+
+    def grab(self, bbox: tuple[int, int, int, int], out: np.ndarray):
+        frame = self.frames[self.index]
+        if bbox[2] > frame.shape[1] or bbox[3] > frame.shape[0]:
+            raise CaptureError(f"bbox {bbox} outside of the {frame.shape[1]}x{frame.shape[0]} screenshot")
+
+        np.copyto(out, frame[bbox[1]:bbox[3], bbox[0]:bbox[2]])
+
+        if self.advance_on_grab:
+            self.advance()
+
+    def screen_size(self) -> Optional[tuple[int, int]]:
+        return self.frames[self.index].shape[1], self.frames[self.index].shape[0]
+
+
+class ScreenCapture:
+    def __init__(self, backend: CaptureBackend, bbox: tuple[int, int, int, int], trace_name: str = 'capture'):
+        self.backend = backend
+        self.bbox = bbox
+        self.trace_name = trace_name
+
+        # Two buffers are swapped on every tick, so a view handed out on the last tick stays intact for one more
+        shape = (bbox[3] - bbox[1], bbox[2] - bbox[0])
+        self._buffers = [np.zeros(shape, dtype=np.uint8), np.zeros(shape, dtype=np.uint8)]
+        self._current = 0
+        self._lock = threading.Lock()
+
+        self.frame_id = 0
+
+    def tick(self) -> np.ndarray:
+        with self._lock, TRACER.span(self.trace_name):
+            back = 1 - self._current
+            self.backend.grab(self.bbox, self._buffers[back])
+
+            self._current = back
+            self.frame_id += 1
+
+            return self.frame()
+
+    def frame(self) -> np.ndarray:
+        view = self._buffers[self._current].view()
+        view.flags.writeable = False
+
+        return view
+
+    def view(self, bbox: tuple[int, int, int, int], frame: np.ndarray = None) -> np.ndarray:
+        # Crop in screen coordinates, without copying
+        if frame is None:
+            frame = self.frame()
+
+        return frame[bbox[1] - self.bbox[1]:bbox[3] - self.bbox[1], bbox[0] - self.bbox[0]:bbox[2] - self.bbox[0]]
@@ -0,0 +1,76 @@
+import argparse
+import sys
+import time
+
+BOARD_SIZE = 15
+
+
+class StubBrain:
+    # A scripted piskvork brain for benchmarks and tests: it thinks for a fixed time and then plays the empty
+    # intersection closest to the centre
+
+    def __init__(self, think_time: float):
+        self.think_time = think_time
+        self.board = {}
+
+    def _write_output(self, output_str: str):
+        sys.stdout.write(output_str + '\r\n')
+        sys.stdout.flush()
+
+    def _play(self):
+        time.sleep(self.think_time)
+
+        x, y = min(
+            ((x, y) for x in range(BOARD_SIZE) for y in range(BOARD_SIZE) if (x, y) not in self.board),
+            key=lambda move: (abs(move[0] - BOARD_SIZE // 2) + abs(move[1] - BOARD_SIZE // 2), move)
+        )
+        self.board[(x, y)] = 1
+        self._write_output(f"{x},{y}")
+
+    def run(self):
+        reading_board = False
+
+        for input_str in sys.stdin:
+            input_str = input_str.strip()
+            command, _, arguments = input_str.partition(' ')
+            command = command.upper()
+
+            if reading_board:
+                if command == 'DONE':
+                    reading_board = False
+                    self._play()
+                else:
+                    x, y, player = (int(value) for value in input_str.split(','))
+                    self.board[(x, y)] = player
+            elif command in ('START', 'RESTART'):
+                self.board = {}
+                self._write_output('OK')
+            elif command == 'BEGIN':
+                self._play()
+            elif command == 'TURN':
+                x, y = (int(value) for value in arguments.split(','))
+                self.board[(x, y)] = 2
+                self._play()
+            elif command == 'BOARD':
+                self.board = {}
+                reading_board = True
+            elif command == 'INFO':
+                pass
+            elif command == 'ABOUT':
+                self._write_output('name="stub", version="1.0"')
+            elif command == 'END':
+                return
+            else:
+                self._write_output(f"UNKNOWN {input_str}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scripted piskvork brain.')
+    parser.add_argument('--think-time', type=float, default=0.0, help='seconds to wait before every move')
+    args = parser.parse_args()
+
+    StubBrain(args.think_time).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+import logging
+import time
+from typing import Optional
+
+from piskvork_client import OWN, OPPONENT
+
+# Own moves a game is expected to last, the match clock is spread over the moves still to go
+EXPECTED_MOVES = 30
+MIN_MOVES_TO_GO = 8
+# Plies during which positions are well known and get a smaller share of the clock
+OPENING_PLIES = 6
+OPENING_FACTOR = 0.5
+# A four on the board leaves a single sensible reply, the brain finds it fast
+FORCED_FACTOR = 0.25
+# Share of the saved time spent on a single middlegame move, and the most a move may get over its nominal budget
+BANK_SPEND = 0.5
+MAX_FACTOR = 3.0
+# Never plan to use more than this share of the remaining clock on one move
+MAX_CLOCK_SHARE = 0.3
+MIN_BUDGET = 0.1
+
+BOARD_SIZE = 15
+DIRECTIONS = ((1, 0), (0, 1), (1, 1), (1, -1))
+
+
+def line_length(stones: dict, x: int, y: int) -> int:
+    # Longest line of same coloured stones through (x, y)
+    player = stones[(x, y)]
+    longest = 0
+
+    for dx, dy in DIRECTIONS:
+        length = 1
+        for sign in (1, -1):
+            step = 1
+            while stones.get((x + sign * step * dx, y + sign * step * dy)) == player:
+                length += 1
+                step += 1
+
+        longest = max(longest, length)
+
+    return longest
+
+
+def makes_four(stones: dict, x: int, y: int) -> bool:
+    # Whether the stone at (x, y) leaves five cells in a row with four of its colour and one empty, so a single move
+    # wins there. Broken fours count, fours blocked at both ends do not.
+    player = stones[(x, y)]
+
+    for dx, dy in DIRECTIONS:
+        for start in range(-4, 1):
+            cells = [(x + (start + i) * dx, y + (start + i) * dy) for i in range(5)]
+            if not all(0 <= cell_x < BOARD_SIZE and 0 <= cell_y < BOARD_SIZE for cell_x, cell_y in cells):
+                continue
+
+            owners = [stones.get(cell) for cell in cells]
+            if owners.count(player) == 4 and owners.count(None) == 1:
+                return True
+
+    return False
+
+
+class TimeManager:
+    def __init__(self, logger: logging.Logger, timeout_turn: float, timeout_match: float = 0.0):
+        self.logger = logger
+        self.timeout_turn = timeout_turn
+        self.timeout_match = timeout_match
+
+        self.time_left = timeout_match
+        # Time saved on instant moves and fast searches, spent on complex positions
+        self.bank = 0.0
+
+        self.instant_moves = 0
+        self.searched_moves = 0
+
+        self._turn_start = None
+        self._nominal = 0.0
+        self._searched = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.timeout_turn != 0 or self.timeout_match != 0
+
+    def new_game(self):
+        self.time_left = self.timeout_match
+        self.bank = 0.0
+        self.instant_moves = 0
+        self.searched_moves = 0
+        self._turn_start = None
+
+    def start_turn(self, moves: list, start_time: float = None):
+        self._turn_start = start_time if start_time is not None else time.monotonic()
+        self._nominal = self._nominal_budget(sum(1 for _, _, player in moves if player == OWN))
+        self._searched = False
+
+    def _nominal_budget(self, own_moves: int) -> float:
+        if self.timeout_match == 0:
+            return self.timeout_turn
+
+        nominal = self.time_left / max(EXPECTED_MOVES - own_moves, MIN_MOVES_TO_GO)
+        if self.timeout_turn != 0:
+            nominal = min(nominal, self.timeout_turn)
+
+        return nominal
+
+    def planned_budget(self, moves: list) -> Optional[float]:
+        # What a search of this position would be given this turn, before the time already spent on it
+        if self._turn_start is None or not self.enabled:
+            return None
+
+        return self._plan(moves)[0]
+
+    def _plan(self, moves: list) -> tuple[float, str]:
+        if self._is_forced(moves):
+            budget, reason = self._nominal * FORCED_FACTOR, 'forced'
+        elif len(moves) < OPENING_PLIES:
+            budget, reason = self._nominal * OPENING_FACTOR, 'opening'
+        else:
+            budget, reason = self._nominal + min(self.bank * BANK_SPEND, self._nominal * (MAX_FACTOR - 1)), 'middlegame'
+
+        # The turn timeout is the most a single move may take, saved time only goes beyond the nominal budget below it
+        if self.timeout_turn != 0:
+            budget = min(budget, self.timeout_turn)
+
+        return budget, reason
+
+    def budget(self, moves: list) -> Optional[float]:
+        # Search time for the brain in seconds, None when the brain should keep its own limits
+        if self._turn_start is None or not self.enabled:
+            return None
+
+        budget, reason = self._plan(moves)
+
+        # Detection and resyncs of this turn already ran on our clock
+        budget -= time.monotonic() - self._turn_start
+        if self.timeout_match != 0:
+            budget = min(budget, self.time_left * MAX_CLOCK_SHARE)
+        budget = max(budget, MIN_BUDGET)
+
+        self.logger.debug(
+            f"Time: {budget:.2f}s for a {reason} move (nominal {self._nominal:.2f}s, "
+            f"bank {self.bank:.2f}s, clock {self.time_left:.1f}s)"
+        )
+
+        return budget
+
+    def searched(self):
+        # The brain was asked for this move, whether it was given a budget or not
+        self._searched = True
+
+    def info(self, budget: float) -> list:
+        info_strs = [f"INFO timeout_turn {int(budget * 1000)}"]
+        if self.timeout_match != 0:
+            info_strs.append(f"INFO time_left {int(max(self.time_left, 0) * 1000)}")
+
+        return info_strs
+
+    def wait_time(self, turn_wait_time: float) -> float:
+        # Searched moves are padded up to the turn wait time, moves that needed no search are played at once
+        if self._turn_start is None or not self._searched:
+            return 0.0
+
+        return max(turn_wait_time - (time.monotonic() - self._turn_start), 0.0)
+
+    def end_turn(self):
+        if self._turn_start is None:
+            return
+
+        elapsed = time.monotonic() - self._turn_start
+        self._turn_start = None
+
+        if self._searched:
+            self.searched_moves += 1
+        else:
+            self.instant_moves += 1
+
+        if self.timeout_match != 0:
+            self.time_left -= elapsed
+        self.bank = max(self.bank + self._nominal - elapsed, 0.0)
+
+        self.logger.debug(
+            f"Time: {'searched' if self._searched else 'instant'} move took {elapsed:.2f}s, "
+            f"bank {self.bank:.2f}s, clock {self.time_left:.1f}s"
+        )
+
+    def _is_forced(self, moves: list) -> bool:
+        # The opponent's last stone made a four, so there is a single cell to block
+        last_move = next(((x, y) for x, y, player in reversed(moves) if player == OPPONENT), None)
+        if last_move is None:
+            return False
+
+        return makes_four({(x, y): player for x, y, player in moves}, *last_move)
@@ -0,0 +1,290 @@
+import argparse
+import itertools
+import json
+import logging
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+from board_renderer import random_game
+from move_cache import canonical_hash
+from opening_book import read_games
+from piskvork_client import BrainError, OWN, OPPONENT
+from piskvork_manager import PiskvorkManager
+from time_manager import line_length
+
+BOARD_SIZE = 15
+
+FIVE = 'five'
+DRAW = 'draw'
+FORFEIT = 'forfeit'
+TIME = 'time'
+
+
+class Player:
+    def __init__(self, name: str, pbrain_path: Path, timeout_turn: float, timeout_match: float = 0.0,
+                 parallel_paths: list = None):
+        self.name = name
+        self.pbrain_path = pbrain_path
+        self.timeout_turn = timeout_turn
+        self.timeout_match = timeout_match
+        self.parallel_paths = parallel_paths
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'Player':
+        return cls(
+            config['name'],
+            Path(config['path']),
+            config['timeout_turn'],
+            config.get('timeout_match', 0.0),
+            [Path(path) for path in config.get('parallel_paths', [])]
+        )
+
+    def start(self, logger: logging.Logger) -> PiskvorkManager:
+        return PiskvorkManager(
+            logger, self.pbrain_path, self.timeout_turn, timeout_match=self.timeout_match,
+            parallel_paths=self.parallel_paths
+        )
+
+
+def generate_openings(count: int, plies: int, seed: int = 0) -> list[list[tuple[int, int]]]:
+    # Random openings around the centre, without any two that are the same position turned or mirrored
+    openings = []
+    seen = set()
+
+    for game_seed in itertools.count(seed):
+        if len(openings) >= count or game_seed - seed > count * 100:
+            break
+
+        opening = random_game(plies, seed=game_seed)[:plies]
+        position_hash, _ = canonical_hash(
+            [(x, y, OWN if i % 2 == 0 else OPPONENT) for i, (x, y) in enumerate(opening)]
+        )
+        if position_hash not in seen:
+            seen.add(position_hash)
+            openings.append(opening)
+
+    return openings
+
+
+def play_game(logger: logging.Logger, black: PiskvorkManager, white: PiskvorkManager,
+              opening: list[tuple[int, int]]) -> dict:
+    # Both brains are sent the opening as a board, and after that only the other side's moves. Every move is timed by
+    # the brain's time manager, the same way the GUI plays, so a player that uses up its match clock loses.
+    moves = list(opening)
+    stones = {(x, y): i % 2 for i, (x, y) in enumerate(moves)}
+    brains = (black, white)
+    started = [False, False]
+    move_times = []
+
+    while len(moves) < BOARD_SIZE * BOARD_SIZE:
+        side = len(moves) % 2
+        brain = brains[side]
+
+        position = [(x, y, OWN if i % 2 == side else OPPONENT) for i, (x, y) in enumerate(moves)]
+        time_manager = brain.time_manager
+
+        start_time = time.monotonic()
+        time_manager.start_turn(position, start_time)
+        try:
+            if started[side]:
+                x, y = brain.get_move(*moves[-1])
+            elif moves:
+                x, y = brain.board(position)
+            else:
+                x, y = brain.begin()
+        except BrainError as e:
+            logger.warning(f"{'Black' if side == 0 else 'White'} failed: {e}")
+            return {'winner': 1 - side, 'reason': FORFEIT, 'moves': moves, 'move_times': move_times}
+
+        move_times.append(time.monotonic() - start_time)
+        time_manager.end_turn()
+        started[side] = True
+
+        if time_manager.timeout_match != 0 and time_manager.time_left < 0:
+            logger.warning(f"{'Black' if side == 0 else 'White'} ran out of match time")
+            return {'winner': 1 - side, 'reason': TIME, 'moves': moves, 'move_times': move_times}
+
+        if not (0 <= x < BOARD_SIZE and 0 <= y < BOARD_SIZE) or (x, y) in stones:
+            logger.warning(f"{'Black' if side == 0 else 'White'} played an illegal move: {(x, y)}")
+            return {'winner': 1 - side, 'reason': FORFEIT, 'moves': moves, 'move_times': move_times}
+
+        moves.append((x, y))
+        stones[(x, y)] = side
+        if line_length(stones, x, y) >= 5:
+            return {'winner': side, 'reason': FIVE, 'moves': moves, 'move_times': move_times}
+
+    return {'winner': None, 'reason': DRAW, 'moves': moves, 'move_times': move_times}
+
+
+def play_pair(first: Player, second: Player, opening: list[tuple[int, int]], opening_index: int,
+              log_level: int) -> list[dict]:
+    # Runs in a worker process: the opening is played twice with the colours swapped, so neither player gets the
+    # better side of it
+    logging.basicConfig(level=log_level, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    logger = logging.getLogger('tournament')
+
+    games = []
+    for black_player, white_player in ((first, second), (second, first)):
+        black = black_player.start(logger)
+        white = white_player.start(logger)
+
+        try:
+            if black.proc is None or white.proc is None:
+                raise RuntimeError(f"Brain of {black_player.name} or {white_player.name} failed to start")
+
+            start_time = time.monotonic()
+            result = play_game(logger, black, white, opening)
+            elapsed = time.monotonic() - start_time
+        finally:
+            for brain in (black, white):
+                if brain.proc is not None:
+                    brain.kill()
+
+        winner = result['winner']
+        games.append({
+            'opening': opening_index,
+            'opening_plies': len(opening),
+            'black': black_player.name,
+            'white': white_player.name,
+            'winner': None if winner is None else (black_player.name, white_player.name)[winner],
+            'reason': result['reason'],
+            'moves': result['moves'],
+            # Search time of every move after the opening, in the order they were played
+            'move_times': result['move_times'],
+            'duration': elapsed
+        })
+
+    return games
+
+
+def elo_difference(score: float) -> float:
+    # Rating difference that makes this share of the points the expected result
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+
+    return -400 * math.log10(1 / score - 1)
+
+
+def summarize(players: list[Player], games: list[dict], elapsed: float) -> dict:
+    summary = {'games': len(games), 'elapsed': elapsed, 'games_per_hour': len(games) / elapsed * 3600, 'players': {}}
+
+    for player in players:
+        played = [game for game in games if player.name in (game['black'], game['white'])]
+        wins = sum(1 for game in played if game['winner'] == player.name)
+        draws = sum(1 for game in played if game['winner'] is None)
+
+        move_times = [
+            move_time
+            for game in played
+            for ply, move_time in enumerate(game['move_times'], game['opening_plies'])
+            if (game['black'] if ply % 2 == 0 else game['white']) == player.name
+        ]
+
+        summary['players'][player.name] = {
+            'games': len(played),
+            'wins': wins,
+            'draws': draws,
+            'losses': len(played) - wins - draws,
+            'forfeits': sum(
+                1 for game in played if game['reason'] == FORFEIT and game['winner'] not in (player.name, None)
+            ),
+            'time_losses': sum(
+                1 for game in played if game['reason'] == TIME and game['winner'] not in (player.name, None)
+            ),
+            'score': (wins + draws / 2) / len(played) if played else 0.0,
+            'mean_move_time': float(np.mean(move_times)) if move_times else 0.0,
+            'p90_move_time': float(np.percentile(move_times, 90)) if move_times else 0.0,
+            'max_move_time': float(np.max(move_times)) if move_times else 0.0
+        }
+
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play brains against each other without a browser.')
+    parser.add_argument('config', type=Path, help='JSON file with the players and the openings')
+    parser.add_argument('--workers', type=int, default=2, help='games played at the same time')
+    parser.add_argument('--results', type=Path, help='write every game and the summary to this JSON file')
+    parser.add_argument('--games', type=Path, help='write the games as text, ready for opening_book.py')
+    parser.add_argument('--debug', action='store_true', help='log at debug level')
+    args = parser.parse_args()
+
+    log_level = logging.DEBUG if args.debug else logging.WARNING
+    logging.basicConfig(level=log_level, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    logger = logging.getLogger('tournament')
+
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+
+    players = [Player.from_config(player_config) for player_config in config['players']]
+
+    if config.get('openings_path'):
+        openings = read_games(Path(config['openings_path']))
+    else:
+        openings = generate_openings(
+            config.get('openings', 10), config.get('opening_plies', 3), config.get('seed', 0)
+        )
+
+    pairs = list(itertools.combinations(players, 2)) * config.get('rounds', 1)
+    print(
+        f"{len(players)} players, {len(openings)} openings, {len(pairs) * len(openings) * 2} games "
+        f"on {args.workers} workers"
+    )
+
+    games = []
+    start_time = time.monotonic()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(play_pair, first, second, opening, opening_index, log_level)
+            for first, second in pairs
+            for opening_index, opening in enumerate(openings)
+        ]
+
+        for future in as_completed(futures):
+            try:
+                pair_games = future.result()
+            except RuntimeError as e:
+                logger.error(f"Games not played: {e}")
+                continue
+
+            games.extend(pair_games)
+            for game in pair_games:
+                print(
+                    f"  opening {game['opening']:3}  {game['black']:>12} - {game['white']:<12} "
+                    f"{game['winner'] or 'draw':>12} by {game['reason']:<7} in {len(game['moves'])} moves, "
+                    f"{game['duration']:.1f}s"
+                )
+
+    summary = summarize(players, games, time.monotonic() - start_time)
+
+    print(f"{summary['games']} games in {summary['elapsed']:.0f}s, {summary['games_per_hour']:.0f} games/h")
+    for name, stats in summary['players'].items():
+        print(
+            f"{name:>12}  {stats['wins']:4} wins {stats['draws']:4} draws {stats['losses']:4} losses "
+            f"({stats['forfeits']} forfeits, {stats['time_losses']} on time)  score {stats['score'] * 100:5.1f}%  "
+            f"move time mean {stats['mean_move_time'] * 1000:6.0f} ms  p90 {stats['p90_move_time'] * 1000:6.0f} ms  "
+            f"max {stats['max_move_time'] * 1000:6.0f} ms"
+        )
+
+    if len(players) == 2:
+        score = summary['players'][players[0].name]['score']
+        print(f"{players[0].name} - {players[1].name}: {elo_difference(score):+.0f} Elo")
+
+    if args.results is not None:
+        with open(args.results, 'w') as f:
+            json.dump({'summary': summary, 'games': games}, f, indent=4)
+
+    if args.games is not None:
+        with open(args.games, 'w') as f:
+            for game in games:
+                f.write(' '.join(f'{x},{y}' for x, y in game['moves']) + '\n')
+
+
+if __name__ == '__main__':
+    main()
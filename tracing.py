@@ -0,0 +1,167 @@
+import json
+import logging
+import math
+import threading
+import time
+from pathlib import Path
+
+# Latency buckets grow by a factor of 10^(1/10), from 1 us to 100 s, with one more bucket on either end
+MIN_LATENCY = 1e-6
+BUCKETS_PER_DECADE = 10
+DECADES = 8
+BUCKET_COUNT = BUCKETS_PER_DECADE * DECADES + 2
+
+# The stages of a move, in the order they run
+STAGES = ('capture', 'detect', 'detection_latency', 'think', 'pad', 'click', 'capture_cell', 'verify', 'move')
+
+
+def bucket_index(seconds: float) -> int:
+    if seconds < MIN_LATENCY:
+        return 0
+
+    return min(int(math.log10(seconds / MIN_LATENCY) * BUCKETS_PER_DECADE) + 1, BUCKET_COUNT - 1)
+
+
+def bucket_value(index: int) -> float:
+    # Geometric middle of the bucket
+    if index == 0:
+        return MIN_LATENCY
+
+    return MIN_LATENCY * 10 ** ((index - 0.5) / BUCKETS_PER_DECADE)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.counts[bucket_index(seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percent: float) -> float:
+        if self.count == 0:
+            return 0.0
+
+        rank = self.count * percent / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bucket_value(index), self.max)
+
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max
+        }
+
+
+class Span:
+    def __init__(self, tracer: 'Tracer', name: str):
+        self.tracer = tracer
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.tracer.record(self.name, time.perf_counter() - self.start)
+
+
+class Tracer:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def span(self, name: str) -> Span:
+        return Span(self, name)
+
+    def record(self, name: str, seconds: float):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+
+            histogram.add(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+
+    def summary(self) -> dict:
+        with self._lock:
+            summaries = {name: histogram.summary() for name, histogram in self._histograms.items()}
+
+        # Known stages first and in move order, anything else after them
+        order = {name: (STAGES.index(name) if name in STAGES else len(STAGES), name) for name in summaries}
+        return {name: summaries[name] for name in sorted(summaries, key=order.get)}
+
+    def format_summary(self) -> str:
+        return '\n'.join(
+            f"{name:>17} {stats['count']:6} x  p50 {stats['p50'] * 1000:8.1f} ms  p90 {stats['p90'] * 1000:8.1f} ms  "
+            f"p99 {stats['p99'] * 1000:8.1f} ms  max {stats['max'] * 1000:8.1f} ms"
+            for name, stats in self.summary().items()
+        )
+
+    def export(self, path: Path):
+        with open(path, 'w') as f:
+            json.dump({'time': time.time(), 'stages': self.summary()}, f, indent=4)
+
+
+# Every stage of the process records into the same tracer, so one summary covers the whole move
+TRACER = Tracer()
+
+
+class TraceReporter:
+    # Logs the summary and rewrites the export file at a fixed interval, and once more when stopped
+    def __init__(self, logger: logging.Logger, tracer: Tracer = TRACER, interval: float = 60.0, path: Path = None):
+        self.logger = logger
+        self.tracer = tracer
+        self.interval = interval
+        self.path = path
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+        self.report()
+
+    def report(self):
+        summary = self.tracer.format_summary()
+        if summary:
+            self.logger.info(f"Latency:\n{summary}")
+
+        if self.path is not None:
+            self.tracer.export(self.path)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.report()